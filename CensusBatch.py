@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+CensusBatch.py
+
+Author: Anderson Wong
+
+Date: October 17, 2026
+
+Description: This is a command-line program that generates many visualizations without
+the CensusVis window. It reads a manifest (a CSV file) with one visualization per row:
+
+    indicator: the URI of the indicator to be visualized
+    name: the display name of the indicator
+    area: the type of administrative area to be visualized (e.g. Neighbourhood)
+    output: the file name for the visualization (saved as output.html)
+
+The visualizations are generated in parallel over a pool of processes, using the same
+pipeline (CensusEngine.run_generate) as the Visualization Generator tab of CensusVis.
+A summary report (a CSV file with the status, run time, peak memory and error message of
+every row) is written when all rows are done. With --table, the values of all the indicators
+of the manifest are also written to one wide CSV table (a row for each area, a column for
+each indicator), fetched with one query per area type (CensusEngine.query_indicators).
+With --server-sum, apportioned values are summed by the SPARQL endpoint instead of locally;
+--upload-weights first uploads the census tract overlap weights of the manifest's area types
+to the endpoint (CensusEngine.upload_weights), which the server-side sums need.
+With --trace, the time each stage of every row took is written to trace.jsonl (one line per
+stage) and trace.trace.json (the Chrome trace event format, one process per worker).
+
+Usage: python CensusBatch.py manifest.csv [--workers N] [--report report.csv] [--replay] [--topojson] [--table table.csv]
+       [--server-sum] [--upload-weights] [--trace trace]
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import CensusEngine
+import CensusQuery
+import CensusTrace
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Columns that every row of the manifest must have
+MANIFEST_COLUMNS = ["indicator", "name", "area", "output"]
+
+"""
+The read_manifest function reads the rows of a manifest CSV file. Returns them as a list of
+dictionaries. Raises ValueError if a column is missing.
+"""
+def read_manifest(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        missing = [column for column in MANIFEST_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError("The manifest is missing the column(s): " + ", ".join(missing))
+        return [{column: row[column].strip() for column in MANIFEST_COLUMNS} for row in reader if any(row.values())]
+
+"""
+The render_output function returns the HTML file name of a manifest row (the pipeline adds
+the .html extension itself, so it is removed from the name that is passed to it)
+"""
+def render_output(job):
+    return job["output"] if job["output"].lower().endswith(".html") else job["output"] + ".html"
+
+"""
+The render_job function generates the visualization of one manifest row. It runs in a worker
+process of the pool. Returns a dictionary describing the outcome (used for the summary report).
+If topojson is True, the map is saved as TopoJSON. If serverside is True, apportioned values
+are summed by the SPARQL endpoint. The stages of the row are returned as Chrome trace events
+in the outcome's trace entry and as JSON lines in its stages entry.
+"""
+def render_job(job, topojson=False, serverside=False):
+    output = render_output(job)
+    report = {"trace": CensusTrace.Trace(output)}
+    start = time.perf_counter()
+    try:
+        CensusEngine.run_generate(job["area"], job["indicator"], job["name"], output[:-5], report, topojson=topojson, serverside=serverside)
+    except Exception as e:
+        status, error = "failed", str(e)
+    else:
+        status, error = "done", ""
+
+    memory = report.get("memory_peak")
+    return {"indicator": job["indicator"], "area": job["area"], "output": output,
+            "status": status, "seconds": round(time.perf_counter() - start, 3),
+            "memory_mb": round(memory / (1024 * 1024), 1) if memory is not None else "", "error": error,
+            "trace": report["trace"].chrome()["traceEvents"], "stages": report["trace"].jsonl()}
+
+"""
+The run_batch function generates the visualization of every manifest row over a pool of
+worker processes and writes the summary report. Returns the list of outcomes in the order
+of the manifest. If trace is given, the stages of every row are saved as trace.jsonl and
+trace.trace.json.
+"""
+def run_batch(jobs, workers=None, report="report.csv", topojson=False, serverside=False, trace=None):
+    outcomes = [None] * len(jobs)
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_job, job, topojson, serverside): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            outcome = future.result()
+            outcomes[futures[future]] = outcome
+            done += 1
+            print("[" + str(done) + "/" + str(len(jobs)) + "] " + outcome["status"] + ": " + outcome["output"]
+                  + (" (" + outcome["error"] + ")" if outcome["error"] else ""))
+
+    # Write the traces of the rows (the events of each worker process share its pid)
+    events = [event for outcome in outcomes for event in outcome.pop("trace")]
+    stages = "".join(outcome.pop("stages") for outcome in outcomes)
+    if trace:
+        with open(trace + ".jsonl", "w", encoding="utf-8") as f:
+            f.write(stages)
+        with open(trace + ".trace.json", "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    
+    # Write the summary report
+    with open(report, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["indicator", "area", "output", "status", "seconds", "memory_mb", "error"])
+        writer.writeheader()
+        writer.writerows(outcomes)
+
+    return outcomes
+
+"""
+The write_table function fetches the values of all the indicators of the manifest rows (one
+query for each area type) and writes them to a wide CSV table with the columns area, areaname
+and one column for each indicator
+"""
+def write_table(jobs, path):
+    import pandas
+    
+    frames = []
+    for area in dict.fromkeys(job["area"] for job in jobs):
+        df = CensusEngine.query_indicators(area, [job["indicator"] for job in jobs if job["area"] == area]).reset_index()
+        df.insert(0, "area", area)
+        frames.append(df)
+    pandas.concat(frames, ignore_index=True).to_csv(path, index=False)
+
+"""
+The main function reads the command-line arguments, runs the batch and prints a summary.
+Returns the exit code of the program (1 if any visualization failed).
+"""
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate CensusVis visualizations from a manifest without the GUI.")
+    parser.add_argument("manifest", help="CSV file with the columns " + ", ".join(MANIFEST_COLUMNS))
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--report", default=None, help="summary report CSV file (default: <manifest>_report.csv)")
+    parser.add_argument("--replay", action="store_true", help="only answer queries from the local SPARQL cache")
+    parser.add_argument("--topojson", action="store_true", help="save the maps as TopoJSON (smaller files)")
+    parser.add_argument("--table", default=None, help="also write the values of all the indicators to this wide CSV table")
+    parser.add_argument("--server-sum", action="store_true", help="sum apportioned values on the SPARQL endpoint")
+    parser.add_argument("--upload-weights", action="store_true", help="upload the census tract overlap weights of the area types first")
+    parser.add_argument("--trace", default=None, help="write the time of every stage to TRACE.jsonl and TRACE.trace.json")
+    args = parser.parse_args(argv)
+
+    jobs = read_manifest(args.manifest)
+    report = args.report or os.path.splitext(args.manifest)[0] + "_report.csv"
+
+    # Worker processes read the replay setting when they import CensusQuery
+    if args.replay:
+        os.environ["CENSUSVIS_REPLAY"] = "1"
+        CensusQuery.configure(replay=True)
+
+    start = time.perf_counter()
+    if args.upload_weights:
+        for area in dict.fromkeys(job["area"] for job in jobs):
+            CensusEngine.upload_weights(area)
+            print("Weights of " + area + " uploaded.")
+    
+    outcomes = run_batch(jobs, args.workers, report, args.topojson, args.server_sum, args.trace)
+    failed = sum(1 for outcome in outcomes if outcome["status"] != "done")
+    
+    if args.table:
+        write_table(jobs, args.table)
+        print("Indicator table saved as " + args.table + ".")
+
+    print(str(len(outcomes) - failed) + " of " + str(len(outcomes)) + " visualizations generated in "
+          + str(round(time.perf_counter() - start, 1)) + " s. Report saved as " + report + ".")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
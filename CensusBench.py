@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+"""
+CensusBench.py
+
+Author: Anderson Wong
+
+Date: October 17, 2026
+
+Description: This is a command-line program that benchmarks the visualization pipeline
+without the SPARQL endpoint. The queries of every benchmark case are answered from recorded
+responses in benchmarks/fixtures (a CensusQuery cache read in replay mode), so the benchmark
+runs fully offline. The cases are listed in benchmarks/cases.json:
+
+    name: the name of the case
+    area: the type of administrative area to be visualized (Ward or Neighbourhood)
+    indicator: the URI of the indicator to be visualized
+    sexes, samearea, properpart: how the synthetic endpoint answers the ASK probes of the
+    case (whether the indicator has male/female values, is available for the areas directly
+    or has to be apportioned from census tracts)
+
+Every case is run once to warm up and then repeat times. The median wall time of each stage
+(see CensusTrace) is compared with benchmarks/baseline.json. A geometry case also times
+CensusTools.overlap_matrix and CensusTools.wktintersect on the recorded tract and
+neighbourhood geometries. Each run starts with an empty parsed geometry cache and weight table.
+
+Wall times depend on the machine and on what else it is running, so a calibration workload
+(Python and Shapely code that does not use CensusVis) is timed before every run of a case and
+its median is saved with the case. The baseline is scaled by how much slower or faster the
+calibration ran (the median over the cases, which is steadier than any one of them). Only the total of each case and the geometry stages (GATED_STAGES)
+are gated: the program exits with 1 if one of them got slower
+than the scaled baseline by more than the tolerance and MIN_SECONDS. The other stages are only
+reported, since stages of a few milliseconds vary too much between runs.
+
+The shipped fixtures are recorded from a synthetic endpoint (--synthesize): a deterministic
+city with 25 wards, 140 neighbourhoods and 572 census tracts, with the sizes of Toronto's. They
+can be re-recorded from the real endpoint with --record (the indicator URIs of cases.json have
+to exist there). Both have to be re-run when the queries of CensusEngine change.
+
+Usage: python CensusBench.py [--repeat 9] [--cases a,b] [--tolerance 0.5] [--save-baseline]
+       [--synthesize] [--record] [--output results.json]
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+import CensusEngine
+import CensusQuery
+import CensusTools
+
+# Files of the benchmark
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+CASES_FILE = os.path.join(BENCH_DIR, "cases.json")
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+
+# A gated stage regresses if it is more than DEFAULT_TOLERANCE (a fraction) and MIN_SECONDS slower
+# than its (scaled) baseline
+DEFAULT_TOLERANCE = 0.5
+MIN_SECONDS = 0.025
+GATED_STAGES = ("total", "overlap_matrix", "wktintersect")
+
+# Default number of timed runs of each case
+DEFAULT_REPEAT = 9
+
+# Number of rows and columns of the polygons of the calibration workload
+CALIBRATION_GRID = 20
+
+# Bounds (west, south, east, north) of the synthetic city, the grid (columns, rows) of each of its
+# area types and the number of points on each side of a synthetic polygon
+CITY_BOUNDS = (-79.64, 43.58, -79.12, 43.86)
+CITY_GRIDS = {"Ward": (5, 5), "Neighbourhood": (14, 10), "CensusTract": (26, 22)}
+SIDE_POINTS = 8
+
+# Number of tract/area pairs the geometry case intersects with wktintersect
+INTERSECT_PAIRS = 1000
+
+TORONTO = "http://ontology.eil.utoronto.ca/Toronto/Toronto#"
+
+"""
+The _noise function returns a deterministic pseudo-random number in [-1, 1) for a point, so
+that a point shared by neighbouring polygons is always moved the same way
+"""
+def _noise(x, y, salt):
+    digest = hashlib.blake2b((salt + " " + format(x, ".9f") + " " + format(y, ".9f")).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 63 - 1
+
+"""
+A SyntheticCity answers the queries of the pipeline like the census SPARQL endpoint, for a
+deterministic city whose administrative areas and census tracts are grids of jagged polygons
+(neighbouring polygons share their boundaries). A census tract is related to (e.g. is a census
+tract of) every area its interior intersects.
+"""
+class SyntheticCity:
+    def __init__(self):
+        from shapely import STRtree
+        from shapely.wkt import loads
+
+        self.areas = {}
+        for areatype, (columns, rows) in CITY_GRIDS.items():
+            self.areas[areatype] = self._grid(areatype, columns, rows)
+        self.tracts = self.areas.pop("CensusTract")
+
+        # Relates every area to the census tracts whose interiors intersect it
+        polygons = [loads(wkt) for iri, name, wkt in self.tracts]
+        tree = STRtree(polygons)
+        self.related = {}
+        for areatype, areas in self.areas.items():
+            for iri, name, wkt in areas:
+                area = loads(wkt)
+                self.related[iri] = [self.tracts[i][0] for i in sorted(tree.query(area, predicate="intersects"))
+                                     if area.intersection(polygons[i]).area > 0]
+
+    """
+    The _grid method returns the polygons of a grid of columns by rows areas over the city as a
+    list of (IRI, name, WKT)
+    """
+    def _grid(self, areatype, columns, rows):
+        west, south, east, north = CITY_BOUNDS
+        width = (east - west) / columns
+        height = (north - south) / rows
+
+        # Moves a point by less than a third of the distance between the points of a side
+        # (points on the boundary of the city are only moved along it)
+        def point(x, y):
+            dx = 0.3 * width / SIDE_POINTS * _noise(x, y, areatype + "x")
+            dy = 0.3 * height / SIDE_POINTS * _noise(x, y, areatype + "y")
+            if abs(x - west) < 1e-12 or abs(x - east) < 1e-12:
+                dx = 0
+            if abs(y - south) < 1e-12 or abs(y - north) < 1e-12:
+                dy = 0
+            return str(round(x + dx, 7)) + " " + str(round(y + dy, 7))
+
+        polygons = []
+        for row in range(rows):
+            for column in range(columns):
+                x0, y0 = west + column * width, south + row * height
+                ring = []
+                for i in range(SIDE_POINTS):
+                    ring.append(point(x0 + i * width / SIDE_POINTS, y0))
+                for i in range(SIDE_POINTS):
+                    ring.append(point(x0 + width, y0 + i * height / SIDE_POINTS))
+                for i in range(SIDE_POINTS):
+                    ring.append(point(x0 + width - i * width / SIDE_POINTS, y0 + height))
+                for i in range(SIDE_POINTS):
+                    ring.append(point(x0, y0 + height - i * height / SIDE_POINTS))
+                ring.append(ring[0])
+                number = row * columns + column + 1
+                polygons.append((TORONTO + areatype + str(number), areatype + " " + str(number), "POLYGON((" + ",".join(ring) + "))"))
+        return polygons
+
+    """
+    The _values method returns the deterministic total, male and female values of an indicator in
+    an area or census tract. About 1 in 100 has no male value ("x"), as in the census data.
+    """
+    def _values(self, characteristic, iri):
+        generator = random.Random(characteristic + " " + iri)
+        total = generator.randint(100, 5000)
+        male = generator.randint(0, total)
+        return total, "x" if generator.random() < 0.01 else male, total - male
+
+    """
+    The answer method returns the raw response (bytes) to a query of the pipeline for a case (a
+    dictionary of cases.json) in the format fmt (JSON for ASK queries, CSV for SELECT queries)
+    """
+    def answer(self, q, case):
+        text = " ".join(q.split())
+
+        # The ASK probes of CensusEngine.probe
+        if text.startswith("PREFIX") and " ASK" in text:
+            if "rdfs:subClassOf iso21972:Indicator" in text:
+                answer = True
+            elif "foaf:Person" in text:
+                answer = case["sexes"]
+            elif "properPartOf ?area" in text:
+                answer = case["properpart"]
+            else:
+                answer = case["samearea"]
+            return json.dumps({"head": {}, "boolean": answer}).encode("utf-8")
+
+        match = re.search(r"SELECT DISTINCT ((?:\?\w+ )+)", text)
+        if match is None:
+            raise ValueError("The synthetic endpoint cannot answer the query: " + text[:200])
+        variables = match.group(1).split()
+        areatype = re.search(r"\?area a toronto:(\w+)", text).group(1)
+        areas = self.areas[areatype]
+        tracts = {iri: (name, wkt) for iri, name, wkt in self.tracts}
+
+        rows = []
+        if variables == ["?area", "?areaname", "?areawkt"]:
+            rows = [[iri, name, wkt] for iri, name, wkt in areas]
+        elif variables == ["?censustract", "?areaname2", "?censuswkt"]:
+            related = dict.fromkeys(tract for iri, name, wkt in areas for tract in self.related[iri])
+            rows = [[tract, tracts[tract][0], tracts[tract][1]] for tract in related]
+        elif variables[0] == "?areaname":
+            for iri, name, wkt in areas:
+                total, male, female = self._values(case["indicator"], iri)
+                values = {"?areaname": name, "?areawkt": wkt, "?sumvalue": total, "?sumvaluemale": male, "?sumvaluefemale": female}
+                rows.append([values[variable] for variable in variables])
+        elif variables[:3] == ["?area", "?censustract", "?value"]:
+            for iri, name, wkt in areas:
+                for tract in self.related[iri]:
+                    total, male, female = self._values(case["indicator"], tract)
+                    rows.append([iri, tract, total, male, female][:len(variables)])
+        else:
+            raise ValueError("The synthetic endpoint cannot answer the query: " + text[:200])
+
+        output = io.StringIO()
+        writer = csv.writer(output, lineterminator="\r\n")
+        writer.writerow([variable[1:] for variable in variables])
+        writer.writerows(rows)
+        return output.getvalue().encode("utf-8")
+
+"""
+The read_cases function reads the benchmark cases of cases.json
+"""
+def read_cases(path=CASES_FILE):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["cases"]
+
+"""
+The run_case function runs the visualization pipeline of a case once, with an empty parsed
+geometry cache and weight table, and returns the wall time of each of its stages (and of the
+whole run as total)
+"""
+def run_case(case):
+    CensusTools.clear_cache()
+    with tempfile.TemporaryDirectory() as directory:
+        CensusTools.WEIGHTS_DIR = os.path.join(directory, "weights")
+        report = {}
+        start = time.perf_counter()
+        CensusEngine.run_generate(case["area"], case["indicator"], case["name"], os.path.join(directory, "map"), report)
+        seconds = time.perf_counter() - start
+
+    stages = report["trace"].stages()
+    stages["total"] = seconds
+    return stages
+
+"""
+The run_geometry function times CensusTools.overlap_matrix (every census tract with every
+neighbourhood) and CensusTools.wktintersect (the first INTERSECT_PAIRS overlapping pairs) on the
+recorded geometries, each with an empty parsed geometry cache
+"""
+def run_geometry():
+    areas = [wkt for name, wkt in CensusEngine.area_geometries("Neighbourhood").values()]
+    tracts = [wkt for name, wkt in CensusEngine.tract_geometries("Neighbourhood", "toronto:hasCensusTract").values()]
+
+    CensusTools.clear_cache()
+    start = time.perf_counter()
+    matrix = CensusTools.overlap_matrix(tracts, areas)
+    stages = {"overlap_matrix": time.perf_counter() - start}
+
+    rows, columns = matrix.nonzero()
+    CensusTools.clear_cache()
+    start = time.perf_counter()
+    for row, column in list(zip(rows.tolist(), columns.tolist()))[:INTERSECT_PAIRS]:
+        CensusTools.wktintersect(tracts[row], areas[column])
+    stages["wktintersect"] = time.perf_counter() - start
+    return stages
+
+"""
+The calibrate function returns the wall time of a fixed workload that does not use CensusVis
+(building WKT strings, parsing and intersecting them with Shapely and serializing the result
+as JSON), which measures how fast the machine currently runs code like the pipeline's
+"""
+def calibrate():
+    import shapely
+
+    start = time.perf_counter()
+    wkts = []
+    for row in range(CALIBRATION_GRID):
+        for column in range(CALIBRATION_GRID):
+            x, y = column * 1.0, row * 1.0
+            ring = [(x + 0.1 * (k % 7), y + 0.05 * k) for k in range(16)] + [(x + 1.5, y + 0.8), (x + 1.5, y), (x, y)]
+            wkts.append("POLYGON((" + ",".join(format(px, ".6f") + " " + format(py, ".6f") for px, py in ring) + "))")
+    geometries = shapely.from_wkt(wkts)
+    areas = shapely.area(shapely.intersection(geometries[:-1], geometries[1:])).tolist()
+    json.dumps({"type": "FeatureCollection", "features": [{"wkt": wkt, "area": area} for wkt, area in zip(wkts, areas)]})
+    return time.perf_counter() - start
+
+"""
+The benchmark function runs every case (and the geometry case) once to warm up and then repeat
+times, timing the calibration workload before each run. Returns the median wall time of each
+stage of each case (and of its calibration) as a dictionary {case: {stage: seconds}}.
+"""
+def benchmark(cases, repeat=DEFAULT_REPEAT):
+    runs = [(case["name"], lambda case=case: run_case(case)) for case in cases]
+    runs.append(("geometry", run_geometry))
+
+    results = {}
+    for name, run in runs:
+        calibrate()
+        run()
+        samples = {}
+        for i in range(repeat):
+            samples.setdefault("calibration", []).append(calibrate())
+            for stage, seconds in run().items():
+                samples.setdefault(stage, []).append(seconds)
+        results[name] = {stage: round(statistics.median(values), 6) for stage, values in samples.items()}
+        total = results[name].get("total", sum(seconds for stage, seconds in results[name].items() if stage != "calibration"))
+        print(name + ": " + str(round(total, 3)) + " s")
+    return results
+
+"""
+The calibration_scale function returns how much slower (above 1) or faster the results ran the
+calibration workload than the baseline (both {case: {stage: seconds}}), as the median of the
+calibration times of the cases in the results divided by that in the baseline. Returns 1 if
+either has no calibration times.
+"""
+def calibration_scale(results, baseline):
+    now = [stages["calibration"] for case, stages in results.items() if "calibration" in stages]
+    before = [stages["calibration"] for case, stages in baseline.items() if "calibration" in stages]
+    if not now or not before:
+        return 1.0
+    return statistics.median(now) / statistics.median(before)
+
+"""
+The compare function compares results with a baseline (both {case: {stage: seconds}}) and prints
+a table of every stage. The baseline is multiplied by scale (see calibration_scale). Returns the list of (case, stage) of GATED_STAGES that regressed (got more than
+tolerance and MIN_SECONDS slower than the scaled baseline).
+"""
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE, scale=1.0):
+    regressions = []
+    print()
+    print("case".ljust(22) + "stage".ljust(20) + "baseline".rjust(10) + "now".rjust(10) + "ratio".rjust(8))
+    for case, stages in results.items():
+        for stage, seconds in stages.items():
+            before = baseline.get(case, {}).get(stage)
+            if before is None:
+                print(case.ljust(22) + stage.ljust(20) + "-".rjust(10) + format(seconds, ".4f").rjust(10) + "new".rjust(8))
+                continue
+            if stage != "calibration":
+                before *= scale
+            ratio = seconds / before if before > 0 else float("inf")
+            regressed = stage in GATED_STAGES and seconds > before * (1 + tolerance) and seconds - before > MIN_SECONDS
+            if regressed:
+                regressions.append((case, stage))
+            print(case.ljust(22) + stage.ljust(20) + format(before, ".4f").rjust(10) + format(seconds, ".4f").rjust(10)
+                  + format(ratio, ".2f").rjust(8) + ("  REGRESSION" if regressed else ""))
+    return regressions
+
+"""
+The record function runs every case once against the endpoint (or the synthetic city if
+synthetic is True) and stores the responses of its queries as the fixtures, replacing the
+old fixtures
+"""
+def record(cases, synthetic=False):
+    CensusQuery.configure(directory=FIXTURES_DIR, ttl=0, replay=False, enabled=True)
+    CensusQuery.clear_cache()
+
+    city = SyntheticCity() if synthetic else None
+    with tempfile.TemporaryDirectory() as directory:
+        # The weights of the recorded areas are not kept
+        CensusTools.WEIGHTS_DIR = directory
+        for case in cases + [{"name": "geometry", "area": "Neighbourhood", "indicator": "", "sexes": True, "samearea": False, "properpart": False}]:
+            if city is not None:
+                CensusQuery._open = lambda q, endpoint, fmt, case=case: io.BytesIO(city.answer(q, case))
+            if case["name"] == "geometry":
+                CensusEngine.area_geometries(case["area"])
+                CensusEngine.tract_geometries(case["area"], "toronto:hasCensusTract")
+            else:
+                CensusEngine.run_generate(case["area"], case["indicator"], case["name"], "", save=False)
+            print("Recorded " + case["name"] + ".")
+
+"""
+The main function reads the command-line arguments, runs the benchmark and compares it with
+the baseline. Returns the exit code of the program (1 if a stage regressed).
+"""
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the CensusVis pipeline offline with recorded SPARQL responses.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="number of timed runs of each case (default: 9)")
+    parser.add_argument("--cases", default=None, help="comma-separated names of the cases to run (default: all)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown as a fraction of the baseline (default: 0.5)")
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--synthesize", action="store_true", help="re-record the fixtures from the synthetic city first")
+    parser.add_argument("--record", action="store_true", help="re-record the fixtures from the SPARQL endpoint first")
+    parser.add_argument("--output", default=None, help="also save the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    cases = read_cases()
+    if args.synthesize or args.record:
+        record(cases, synthetic=args.synthesize)
+    if args.cases:
+        names = args.cases.split(",")
+        cases = [case for case in cases if case["name"] in names]
+
+    # Every query is answered from the fixtures
+    CensusQuery.configure(directory=FIXTURES_DIR, replay=True, enabled=True)
+    results = benchmark(cases, args.repeat)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump({"machine": platform.platform(), "python": platform.python_version(), "repeat": args.repeat, "cases": results}, f, indent=2)
+            f.write("\n")
+        print("Baseline saved as " + BASELINE_FILE + ".")
+        return 0
+
+    if not os.path.exists(BASELINE_FILE):
+        print("There is no baseline yet (save one with --save-baseline).")
+        return 0
+
+    with open(BASELINE_FILE, encoding="utf-8") as f:
+        baseline = json.load(f)
+    scale = calibration_scale(results, baseline["cases"])
+    regressions = compare(results, baseline["cases"], args.tolerance, scale)
+    print()
+    print(str(len(regressions)) + " stage(s) regressed by more than " + str(round(args.tolerance * 100)) + "%"
+          + " (baseline recorded on " + baseline.get("machine", "an unknown machine") + ", scaled by "
+          + format(scale, ".2f") + " for this machine).")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
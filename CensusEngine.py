@@ -0,0 +1,1389 @@
+# -*- coding: utf-8 -*-
+"""
+CensusEngine.py
+
+Author: Anderson Wong
+
+Date: October 17, 2026
+
+Description: This is a Python module that contains the search and visualization pipelines
+of CensusVis, without any of its window code, so that they can be used by CensusBatch, scripts
+and services without a display server:
+
+    1. area_types(): a function that returns the types of administrative areas
+
+    2. run_search(search): a function that returns the indicators whose description
+    contains the search terms, from the local index of the indicator catalog (CensusIndex)
+
+    3. run_generate(area, characteristic, indicator, filename): a function that generates
+    the visualization of an indicator for a type of administrative area, saves it as
+    filename.html and returns its HTML. Its stages are also available on their own:
+    probe, query_values and render_map.
+
+Both pipelines accept optional progress and cancelled callbacks (see checkpoint). Pandas and
+folium are only imported when a pipeline first needs them, so importing this module is fast.
+"""
+import geojson
+import CensusIndex
+import CensusQuery
+import CensusTools
+import CensusTrace
+import numpy
+import os
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Highest zoom level rendered maps keep full detail for, and the number of decimals their coordinates are rounded to
+RENDER_ZOOM = 16
+COORDINATE_DIGITS = 5
+
+# Grid size that TopoJSON maps quantize their coordinates to
+TOPOJSON_QUANTIZATION = 100000
+
+# Namespace of the census tract/area overlap weights uploaded to the SPARQL endpoint, and the
+# named graph (followed by the administrative area type) they are uploaded to
+WEIGHTS_NS = "urn:censusvis:weights#"
+WEIGHTS_GRAPH = "urn:censusvis:weights:"
+
+# Relations between administrative areas and census tracts that values are apportioned over
+TRACT_RELATIONS = ["toronto:hasCensusTract", "iso5087m:hasProperPart", "iso5087m:properPartOf"]
+
+# Raised inside a pipeline when the user cancels it
+class Cancelled(Exception):
+    pass
+
+"""
+The checkpoint function is called by the pipelines between their stages. It stops the
+pipeline (by raising Cancelled) if the user has cancelled it, otherwise it reports the
+stage that is about to run.
+"""
+def checkpoint(progress, cancelled, message):
+    if cancelled is not None and cancelled():
+        raise Cancelled()
+    if progress is not None:
+        progress(message)
+
+"""
+The traced function calls fn with args and records the call as a stage called name in trace
+(with the number of items it returned as its rows). Used for functions run on other threads.
+"""
+def traced(trace, name, fn, *args):
+    with CensusTrace.stage(trace, name) as values:
+        result = fn(*args)
+        values["rows"] = len(result)
+    return result
+
+"""
+The area_types function returns the names of the types of administrative areas that can be
+visualized (e.g. Ward, Neighbourhood)
+"""
+def area_types(progress=None, cancelled=None):
+    checkpoint(progress, cancelled, "Loading the types of administrative areas...")
+    
+    # SPARQL query that returns the types of administrative areas
+    q = """
+    PREFIX iso50872: <http://ontology.eil.utoronto.ca/5087/2/City/>
+    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+    SELECT DISTINCT ?area
+    FROM <http://www.ontotext.com/explicit>
+    WHERE{
+    ?area rdfs:subClassOf iso50872:CityAdministrativeArea;
+    } 
+    """
+    
+    # Converts SPARQL query results into a Pandas DataFrame
+    df = CensusQuery.dataframe(q)
+    
+    # Business improvement areas are not visualized
+    areas = []
+    for index, row in df.iterrows():
+        if row["area"] != "http://ontology.eil.utoronto.ca/Toronto/Toronto#BusinessImprovementArea":
+            areas.append(row["area"].replace("http://ontology.eil.utoronto.ca/Toronto/Toronto#", ""))
+    
+    return areas
+
+"""
+The run_search function searches the local index of the indicator catalog for the indicators
+whose URI or description contains every search term (or words beginning with them). The index
+is only fetched from the SPARQL endpoint the first time, or when refresh is True. If within is
+not None, only the results of a previous search in it are searched (see narrows). Returns the
+results as a list of [indicator URI, description] pairs, best matches first.
+"""
+def run_search(search, progress=None, cancelled=None, refresh=False, within=None):
+    checkpoint(progress, cancelled, "Loading the indicator catalog...")
+    index = CensusIndex.catalog_index(refresh)
+    
+    checkpoint(progress, cancelled, "Searching for \"" + search + "\"...")
+    return index.search(search, within=within)
+
+"""
+The narrows function returns whether every result of the search could only be a result of
+the previous search too (the search extends the previous one, e.g. "inc" after "in"), so that
+the search can be run on the results of the previous search instead of the whole catalog
+"""
+def narrows(previous, search):
+    return search.startswith(previous)
+
+"""
+The indicator_classes function returns the URIs of the classes that define the total, male
+and female populations of an indicator
+"""
+def indicator_classes(characteristic):
+    person = characteristic.replace("http://ontology.eil.utoronto.ca/tove/cacensus#", "http://ontology.eil.utoronto.ca/tove/cacensus#" + "Person")
+    male = characteristic.replace("http://ontology.eil.utoronto.ca/tove/cacensus#", "http://ontology.eil.utoronto.ca/tove/cacensus#" + "Male")
+    female = characteristic.replace("http://ontology.eil.utoronto.ca/tove/cacensus#", "http://ontology.eil.utoronto.ca/tove/cacensus#" + "Female")
+    
+    return person, male, female
+
+"""
+The probe function checks the indicator against the selected type of administrative area.
+Returns 3 booleans:
+    hassexes: whether the indicator has values for the male/female population
+    samearea: whether the administrative area of the indicator is the same as the selected one
+    properpart: whether the administrative area of the indicator is a properPartOf the selected one
+Raises ValueError if the indicator URI is invalid.
+"""
+def probe(area, characteristic):
+    # SPARQL query to check if indicator URI input is valid
+    validq = "PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#>  ASK {<" + characteristic + "> rdfs:subClassOf iso21972:Indicator}"
+    
+    person, male, female = indicator_classes(characteristic)
+    # SPARQL query to check whether the characteristic has values for male/female population
+    q1 = "PREFIX uoft: <http://ontology.eil.utoronto.ca/tove/cacensus#> PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#> PREFIX foaf: <http://xmlns.com/foaf/0.1/> ASK {<" + male + "> rdfs:subClassOf foaf:Person}"
+    
+    # SPARQL query to check if the administrative area of the indicator is the same as the administrative area for the visualization
+    q2 = """
+    PREFIX uoft: <http://ontology.eil.utoronto.ca/tove/cacensus#>
+    PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
+    PREFIX iso50872: <http://ontology.eil.utoronto.ca/5087/2/City/>
+ 
+    ASK{
+    ?area2 a iso50872:CityAdministrativeArea.
+    ?limat a <""" + characteristic + """>;
+    ?p ?area2.
+    ?area2 a toronto:""" + area + """
+    }
+    """
+    
+    # SPARQL query to check if the administrative area of the indicator is a properPartOf the administrative area for the visualization
+    q3 = """
+    PREFIX uoft: <http://ontology.eil.utoronto.ca/tove/cacensus#>
+    PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
+    PREFIX iso50872: <http://ontology.eil.utoronto.ca/5087/2/City/>
+    PREFIX iso5087m: <http://ontology.eil.utoronto.ca/5087/1/Mereology/>
+    
+    ASK{
+    ?area a toronto:""" + area + """.
+    ?area2 a iso50872:CityAdministrativeArea.
+    ?limat a <""" + characteristic + """>;
+    ?p ?area2.
+    ?area2 iso5087m:properPartOf ?area
+    }
+    """
+    
+    # Send the 4 ASK queries at the same time, since none of them depends on another's result
+    # (CensusQuery.ask uses a separate SPARQLWrapper instance for each query)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        valid, results, results2, results3 = pool.map(CensusQuery.ask, [validq, q1, q2, q3])
+    
+    if valid["boolean"] == False:
+        raise ValueError("Sorry, your Indicator URI input is invalid.")
+    
+    return results["boolean"], results2["boolean"], results3["boolean"]
+
+"""
+The area_geometries function queries the name and geometry of every administrative area of
+the selected type. Returns a dictionary that maps the IRI of each area to (name, WKT).
+"""
+def area_geometries(area):
+    # SPARQL query that returns the name and geometry of each administrative area
+    q = """
+    PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
+    PREFIX iso50871: <http://ontology.eil.utoronto.ca/5087/1/SpatialLoc/>
+    PREFIX geo: <http://www.opengis.net/ont/geosparql#>
+    SELECT DISTINCT ?area ?areaname ?areawkt
+    WHERE{
+    ?area a toronto:""" + area + """;
+    rdfs:comment ?areaname;
+    iso50871:hasLocation ?location.
+    
+    ?location geo:asWKT ?areawkt.
+    }
+    """
+    
+    areas = {}
+    for result in CensusQuery.stream(q):
+        areas.setdefault(result["area"].value, (result["areaname"].value, result["areawkt"].value))
+    return areas
+
+"""
+The tract_geometries function queries the name and geometry of every census tract that is
+related (by relation, e.g. toronto:hasCensusTract) to an administrative area of the selected
+type. Returns a dictionary that maps the IRI of each census tract to (name, WKT).
+"""
+def tract_geometries(area, relation):
+    # SPARQL query that returns the name and geometry of each census tract
+    q = """
+    PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
+    PREFIX iso50871: <http://ontology.eil.utoronto.ca/5087/1/SpatialLoc/>
+    PREFIX iso5087m: <http://ontology.eil.utoronto.ca/5087/1/Mereology/>
+    PREFIX geo: <http://www.opengis.net/ont/geosparql#>
+    SELECT DISTINCT ?censustract ?areaname2 ?censuswkt
+    WHERE{
+    ?area a toronto:""" + area + """;
+    """ + relation + """ ?censustract.
+    
+    ?censustract rdfs:comment ?areaname2;
+    iso50871:hasLocation ?censuslocation.
+    
+    ?censuslocation geo:asWKT ?censuswkt.
+    }
+    """
+    
+    tracts = {}
+    for result in CensusQuery.stream(q):
+        tracts.setdefault(result["censustract"].value, (result["areaname2"].value, result["censuswkt"].value))
+    return tracts
+
+"""
+The query_values function queries the values of the indicator for the selected type of
+administrative area, apportioning census tract values to the areas when the indicator is
+not available for them directly. Returns a GeoJSON feature collection with a feature for each
+area and the values as a Pandas DataFrame. Both belong to the run that queried them.
+If serverside is True, the apportioned values are summed by the SPARQL endpoint, using the
+weights uploaded with upload_weights (see server_sums). If trace is not None, the stages of
+the query are recorded in it (see CensusTrace).
+"""
+def query_values(area, characteristic, hassexes, samearea, properpart, progress=None, cancelled=None, serverside=False, trace=None):
+    import pandas
+    
+    person, male, female = indicator_classes(characteristic)
+    
+    # Initialize a GeoJSON variable for the features of this run
+    geoj = {"type": "FeatureCollection", "features": []}
+    
+    # If the selected administrative area is the same as the indicator's administrative area, use one of the following 2 SPARQL queries.
+    if samearea:    
+        if hassexes:
+            """
+            If values for male/female population exist, query for:
+                ?areaname: Name of the administrative area
+                ?areawkt: The polygon coordinates for the administrative area in WKT format
+                ?sumvalue: The value of the characteristic for the total population
+                ?sumvaluemale: The value of the characteristic for the male population
+                ?sumvaluefemale: The value of the characteristic for the female population
+            """
+                                        
+            q = """
+            PREFIX uoft: <http://ontology.eil.utoronto.ca/tove/cacensus#>
+            PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
+            PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#> 
+            PREFIX iso50871: <http://ontology.eil.utoronto.ca/5087/1/SpatialLoc/>
+            PREFIX iso5087m: <http://ontology.eil.utoronto.ca/5087/1/Mereology/>
+            PREFIX geo: <http://www.opengis.net/ont/geosparql#>
+            PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+            SELECT DISTINCT ?areaname
+            ?sumvalue
+            ?areawkt
+            ?sumvaluemale
+            ?sumvaluefemale
+            
+            WHERE{
+            ?area a toronto:""" + area + """;
+            rdfs:comment ?areaname;
+            iso50871:hasLocation ?location. 
+           
+            ?location geo:asWKT ?areawkt.
+            
+            ?limat a <""" + characteristic + """>; 
+            uoft:hasLocation ?area; 
+            iso21972:cardinality_of ?population; 
+            iso21972:value ?measure.
+            
+            ?measure iso21972:numerical_value ?sumvalue. 
+        
+            ?population a ?populationclass. 
+            ?populationclass iso21972:defined_by <""" + person + """>.
+            
+            ?limatmale a <""" + characteristic + """>; 
+            uoft:hasLocation ?area; 
+            iso21972:cardinality_of ?populationmale; 
+            iso21972:value ?measuremale.
+                
+            ?measuremale iso21972:numerical_value ?sumvaluemale. 
+            
+            ?populationmale a ?populationclassmale. 
+            ?populationclassmale iso21972:defined_by <""" + male + """>.
+            
+            ?limatfemale a <""" + characteristic + """>; 
+            uoft:hasLocation ?area; 
+            iso21972:cardinality_of ?populationfemale; 
+            iso21972:value ?measurefemale.
+                
+            ?measurefemale iso21972:numerical_value ?sumvaluefemale. 
+        
+            ?populationfemale a ?populationclassfemale. 
+            ?populationclassfemale iso21972:defined_by <""" + female + """>.
+            } 
+            """
+        
+            # Converts SPARQL query results into a Pandas DataFrame
+            with CensusTrace.stage(trace, "select") as values:
+                df = CensusQuery.dataframe(q)
+                values["rows"] = len(df)
+            
+            # Adds the data in the DataFrame to the geoj GeoJSON variable
+            with CensusTrace.stage(trace, "features"):
+                for index, row in df.iterrows():
+                    geoj["features"].append(geojson.Feature(geometry=CensusTools.wkttopoly(row['areawkt']), properties={"areaname": row["areaname"], "sumvalue": row["sumvalue"], "sumvaluemale": row["sumvaluemale"], "sumvaluefemale": row["sumvaluefemale"]}))
+        
+        else:
+            """
+            Else, query for:
+                ?areaname: Name of the administrative area
+                ?areawkt: The polygon coordinates for the administrative area in WKT format
+                ?sumvalue: The value of the characteristic for the total population
+            """
+            
+            q = """
+            PREFIX uoft: <http://ontology.eil.utoronto.ca/tove/cacensus#>
+            PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
+            PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#> 
+            PREFIX iso50871: <http://ontology.eil.utoronto.ca/5087/1/SpatialLoc/>
+            PREFIX iso5087m: <http://ontology.eil.utoronto.ca/5087/1/Mereology/>
+            PREFIX geo: <http://www.opengis.net/ont/geosparql#>
+            PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+            SELECT DISTINCT ?areaname
+            ?areawkt
+            ?sumvalue
+            FROM <http://www.ontotext.com/explicit>
+            WHERE{
+            ?area a toronto:""" + area + """;
+            rdfs:comment ?areaname;
+            iso50871:hasLocation ?location. 
+           
+            ?location geo:asWKT ?areawkt.
+            
+            ?limat a <""" + characteristic + """>; 
+            ?p ?area; 
+            iso21972:value ?measure.
+            
+            ?measure iso21972:numerical_value ?sumvalue. 
+            } 
+            """
+        
+            # Converts SPARQL query results into a Pandas DataFrame
+            with CensusTrace.stage(trace, "select") as values:
+                df = CensusQuery.dataframe(q)
+                values["rows"] = len(df)
+            
+            # Adds the data in the DataFrame to the geoj GeoJSON variable
+            with CensusTrace.stage(trace, "features"):
+                for index, row in df.iterrows():
+                    geoj["features"].append(geojson.Feature(geometry=CensusTools.wkttopoly(row['areawkt']), properties={"areaname": row["areaname"], "sumvalue": row["sumvalue"]}))
+            
+    # Else, use one of the following 2 SPARQL queries.      
+    else:
+        """
+        The census tract values are apportioned to the administrative areas. The geometries are
+        queried separately from the values (the area geometries once, the census tract geometries
+        once) and joined to the values locally by IRI, so that each WKT polygon is only transferred
+        once instead of once for every row. The geometry queries do not depend on the indicator,
+        so their cached results are reused by every indicator.
+        """
+        if hassexes:
+            """
+            If values for male/female population exist, query for:
+                ?area: The administrative area
+                ?censustract: A census tract located in the administrative area
+                ?value: The value of the characteristic for the total population in the census tract
+                ?valuemale: The value of the characteristic for the male population in the census tract
+                ?valuefemale: The value of the characteristic for the female population in the census tract
+            """
+            relation = "toronto:hasCensusTract"
+            
+            q = """
+            PREFIX uoft: <http://ontology.eil.utoronto.ca/tove/cacensus#>
+            PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
+            PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#> 
+            SELECT DISTINCT ?area
+            ?censustract
+            ?value
+            ?valuemale
+            ?valuefemale
+        
+            WHERE{
+            ?area a toronto:""" + area + """;
+            toronto:hasCensusTract ?censustract.
+                
+            ?limat a <""" + characteristic + """>; 
+            uoft:hasLocation ?censustract; 
+            iso21972:cardinality_of ?population; 
+            iso21972:value ?measure.
+                
+            ?measure iso21972:numerical_value ?value. 
+        
+            ?population a ?populationclass. 
+            ?populationclass iso21972:defined_by <""" + person + """>.
+            
+            ?limatmale a <""" + characteristic + """>; 
+            uoft:hasLocation ?censustract; 
+            iso21972:cardinality_of ?populationmale; 
+            iso21972:value ?measuremale.
+                
+            ?measuremale iso21972:numerical_value ?valuemale. 
+        
+            ?populationmale a ?populationclassmale. 
+            ?populationclassmale iso21972:defined_by <""" + male + """>.
+            
+            ?limatfemale a <""" + characteristic + """>; 
+            uoft:hasLocation ?censustract; 
+            iso21972:cardinality_of ?populationfemale; 
+            iso21972:value ?measurefemale.
+                
+            ?measurefemale iso21972:numerical_value ?valuefemale. 
+        
+            ?populationfemale a ?populationclassfemale. 
+            ?populationclassfemale iso21972:defined_by <""" + female + """>.
+            } 
+            """
+            
+        else:
+            """
+            Else, query for:
+                ?area: The administrative area
+                ?censustract: A census tract that is a properPartOf the administrative area (or the
+                administrative area is a properPartOf)
+                ?value: The value of the characteristic for the total population in the census tract
+            """
+            if properpart:
+                relation = "iso5087m:hasProperPart"
+            else:
+                relation = "iso5087m:properPartOf"
+            
+            q = """
+            PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
+            PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#> 
+            PREFIX iso5087m: <http://ontology.eil.utoronto.ca/5087/1/Mereology/>
+            SELECT DISTINCT ?area
+            ?censustract
+            ?value
+            
+            WHERE{
+            ?area a toronto:""" + area + """;
+            """ + relation + """ ?censustract.
+                
+            ?limat a <""" + characteristic + """>; 
+            ?p ?censustract; 
+            iso21972:value ?measure.
+                
+            ?measure iso21972:numerical_value ?value. 
+            } 
+            """
+        
+        # Sum the values weighted by the overlaps on the SPARQL endpoint (see server_sums)
+        if serverside:
+            with CensusTrace.stage(trace, "server_sums") as values:
+                sums, labels, wkts = server_sums(area, q, hassexes, relation, progress, cancelled)
+                values["rows"] = len(sums)
+        else:
+            # Query the area and census tract geometries on their own threads while the values are streamed
+            pool = ThreadPoolExecutor(max_workers=2)
+            areafuture = pool.submit(traced, trace, "area_geometries", area_geometries, area)
+            tractfuture = pool.submit(traced, trace, "tract_geometries", tract_geometries, area, relation)
+            pool.shutdown(wait=False)
+        
+            # Columns of the joined query results (one entry for each value of a census tract in an administrative area)
+            columns = {"areaname": [], "areawkt": [], "areaname2": [], "value": [], "valuemale": [], "valuefemale": [], "multiplier": []}
+        
+            # Streams the SPARQL query results in batches. The next batch is downloaded on a background
+            # thread while the census tracts of the current batch are being apportioned. The select stage
+            # is only the time spent waiting for the batches (the apportion stages are separate).
+            selected = {"rows": 0}
+            for bindings in CensusTrace.iterate(trace, "select", CensusQuery.batches(CensusQuery.stream(q)), selected):
+                checkpoint(progress, cancelled, "Apportioning census tracts to areas...")
+                areas = areafuture.result()
+                tracts = tractfuture.result()
+                selected["rows"] += len(bindings)
+            
+                # Joins each value to the name and geometry of its administrative area and census tract
+                # (values of areas or census tracts without a geometry are skipped)
+                rows = []
+                for result in bindings:
+                    if result["area"].value in areas and result["censustract"].value in tracts:
+                        areaname, areawkt = areas[result["area"].value]
+                        areaname2, censuswkt = tracts[result["censustract"].value]
+                        rows.append((result, areaname, areawkt, areaname2, censuswkt))
+            
+                # Uses the overlap_weights function from the CensusTools module to look up how much
+                # of each census tract overlaps with its administrative area in the stored weight table
+                # (pairs that are not in the table yet are calculated in one call and stored)
+                with CensusTrace.stage(trace, "apportion", rows=len(rows)):
+                    multipliers = CensusTools.overlap_weights(area, [row[0]["censustract"].value for row in rows], [row[0]["area"].value for row in rows], [row[4] for row in rows], [row[2] for row in rows])
+            
+                # Appends the batch to the columns (values that are missing are None)
+                columns["areaname"].extend(row[1] for row in rows)
+                columns["areawkt"].extend(row[2] for row in rows)
+                columns["areaname2"].extend(row[3] for row in rows)
+                for name in ("value", "valuemale", "valuefemale"):
+                    columns[name].extend(row[0][name].value if name in row[0] else None for row in rows)
+                columns["multiplier"].append(multipliers)
+        
+            columns["multiplier"] = numpy.concatenate(columns["multiplier"]) if columns["multiplier"] else numpy.zeros(0)
+            results = pandas.DataFrame(columns)
+        
+            # Converts the values to numbers. If a value is missing or is not a number (no data),
+            # the total, male, female values of the census tract are set to 0.
+            values = results[["value", "valuemale", "valuefemale"]].apply(pandas.to_numeric, errors="coerce")
+            if not hassexes:
+                values[["valuemale", "valuefemale"]] = 0
+            values = values.mul(values.notna().all(axis=1), axis=0).fillna(0)
+        
+            # Multiplies the total, male, female values by the overlap and adds them up for each administrative area
+            # (the areas are kept in the order they first appear in the query results)
+            weighted = values.mul(results["multiplier"], axis=0)
+            weighted.columns = ["sumvalue", "sumvaluemale", "sumvaluefemale"]
+            weighted["areaname"] = results["areaname"]
+            sums = weighted.groupby("areaname", sort=False).sum()
+        
+            # Builds the list of census tracts used for the calculation of each administrative area once
+            results["label"] = "<br>" + results["areaname2"].astype(str) + ": " + (results["multiplier"] * 100).round(1).astype(str)
+            grouped = results.groupby("areaname", sort=False)
+            labels = grouped["label"].agg("".join)
+            wkts = grouped["areawkt"].first()
+        
+        # Rounds sumvalue, sumvaluemale, sumvaluefemale to the nearest whole number
+        sums = sums.round().astype("int64")
+        
+        # Converts the sums into a Pandas DataFrame and GeoJSON
+        areanames = [name + "<br> <br>" for name in sums.index]
+        sumvalues, sumvaluesmale, sumvaluesfemale = sums["sumvalue"].tolist(), sums["sumvaluemale"].tolist(), sums["sumvaluefemale"].tolist()
+        df = pandas.DataFrame({"areaname": areanames, "wkt": wkts.tolist(), "sumvalue": sumvalues})
+        if hassexes:
+            df["sumvaluemale"] = sumvaluesmale
+            df["sumvaluefemale"] = sumvaluesfemale
+        
+        with CensusTrace.stage(trace, "features"):
+            for areaname, wkt, multiplier, sumvalue, sumvaluemale, sumvaluefemale in zip(areanames, wkts.tolist(), labels.tolist(), sumvalues, sumvaluesmale, sumvaluesfemale):
+                if hassexes:
+                    properties = {"areaname": areaname, "sumvalue": sumvalue, "sumvaluemale": sumvaluemale, "sumvaluefemale": sumvaluefemale, "multiplier": multiplier}
+                else:
+                    properties = {"areaname": areaname, "sumvalue": sumvalue, "multiplier": multiplier}
+                geoj["features"].append(geojson.Feature(geometry=CensusTools.wkttopoly(wkt), properties=properties))
+    
+    return geoj, df
+
+"""
+The aggregate_query function wraps a census tract values query of query_values (q) in a query
+that sums the values weighted by the overlap weights uploaded for the selected type of
+administrative area (only those in its graph WEIGHTS_GRAPH + area) on the SPARQL endpoint, so
+that one row is returned for each administrative area. As in query_values, the values of a
+census tract count as 0 if any of them is not a number. Query for:
+    ?area: The administrative area
+    ?sumvalue, ?sumvaluemale, ?sumvaluefemale: The weighted sums of the values
+    ?censustracts: The census tracts used for the calculation, each followed by its weight
+    (separated by spaces)
+"""
+def aggregate_query(q, hassexes, area):
+    lines = q.strip().split("\n")
+    prefixes = [line for line in lines if line.strip().startswith("PREFIX")]
+    select = "\n".join(line for line in lines if not line.strip().startswith("PREFIX"))
+    
+    names = ["value", "valuemale", "valuefemale"] if hassexes else ["value"]
+    valid = " + ".join("xsd:double(?" + name + ") * 0" for name in names)
+    
+    return "\n".join(prefixes) + """
+    PREFIX cvw: <""" + WEIGHTS_NS + """>
+    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+    SELECT ?area
+    (SUM(?v) AS ?sumvalue)
+    (SUM(?vmale) AS ?sumvaluemale)
+    (SUM(?vfemale) AS ?sumvaluefemale)
+    (GROUP_CONCAT(CONCAT(STR(?censustract), " ", STR(?w)); separator=" ") AS ?censustracts)
+    WHERE{
+    {
+    """ + select + """
+    }
+    
+    GRAPH <""" + WEIGHTS_GRAPH + area + """> {
+    ?weight cvw:area ?area;
+    cvw:tract ?censustract;
+    cvw:weight ?w.
+    }
+    
+    BIND(COALESCE(""" + valid + """ + 1, 0) AS ?valid)
+    BIND(COALESCE(xsd:double(?value), 0) * ?valid * ?w AS ?v)
+    BIND(""" + ("COALESCE(xsd:double(?valuemale), 0) * ?valid * ?w" if hassexes else "0") + """ AS ?vmale)
+    BIND(""" + ("COALESCE(xsd:double(?valuefemale), 0) * ?valid * ?w" if hassexes else "0") + """ AS ?vfemale)
+    }
+    GROUP BY ?area
+    """
+
+"""
+The server_sums function runs the aggregate_query of a census tract values query of
+query_values (q) and returns, like the local calculation in query_values, the sums of every
+administrative area (a DataFrame indexed by area name with the columns sumvalue,
+sumvaluemale and sumvaluefemale), the list of census tracts used for the calculation of every
+area (with the weights returned by the endpoint) and the WKT of every area. Areas whose
+census tracts have no uploaded weights get no value; upload_weights has to be run for the
+area type first.
+"""
+def server_sums(area, q, hassexes, relation, progress=None, cancelled=None):
+    import pandas
+    
+    # Query the area and census tract geometries on their own threads while the sums are queried
+    pool = ThreadPoolExecutor(max_workers=2)
+    areafuture = pool.submit(area_geometries, area)
+    tractfuture = pool.submit(tract_geometries, area, relation)
+    pool.shutdown(wait=False)
+    
+    columns = {"areaname": [], "sumvalue": [], "sumvaluemale": [], "sumvaluefemale": []}
+    labels = []
+    wkts = []
+    for bindings in CensusQuery.batches(CensusQuery.stream(aggregate_query(q, hassexes, area))):
+        checkpoint(progress, cancelled, "Summing census tracts on the server...")
+        areas = areafuture.result()
+        tracts = tractfuture.result()
+        
+        for result in bindings:
+            if result["area"].value not in areas:
+                continue
+            areaname, areawkt = areas[result["area"].value]
+            columns["areaname"].append(areaname)
+            for name in ("sumvalue", "sumvaluemale", "sumvaluefemale"):
+                columns[name].append(float(result[name].value) if name in result else 0.0)
+            wkts.append(areawkt)
+            
+            # Builds the list of census tracts used for the calculation from the weights the endpoint summed with
+            label = ""
+            words = result["censustracts"].value.split() if "censustracts" in result else []
+            for censustract, weight in zip(words[0::2], words[1::2]):
+                if censustract in tracts:
+                    label += "<br>" + tracts[censustract][0] + ": " + str(round(float(weight) * 100, 1))
+            labels.append(label)
+    
+    sums = pandas.DataFrame(columns).set_index("areaname")
+    return sums, pandas.Series(labels, index=sums.index, dtype=object), pandas.Series(wkts, index=sums.index, dtype=object)
+
+"""
+The tract_pairs function queries every administrative area of the selected type and the
+census tracts related to it by relation. Returns a list of (area IRI, census tract IRI).
+"""
+def tract_pairs(area, relation):
+    q = """
+    PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
+    PREFIX iso5087m: <http://ontology.eil.utoronto.ca/5087/1/Mereology/>
+    SELECT DISTINCT ?area ?censustract
+    WHERE{
+    ?area a toronto:""" + area + """;
+    """ + relation + """ ?censustract.
+    }
+    """
+    return [(result["area"].value, result["censustract"].value) for result in CensusQuery.stream(q)]
+
+"""
+The weights_turtle function calculates (or looks up in the weight table) the overlap weight
+of every administrative area of the selected type with each of its census tracts and returns
+them as RDF in the Turtle format. Each weight is a resource with the properties cvw:area,
+cvw:tract and cvw:weight (cvw is WEIGHTS_NS).
+"""
+def weights_turtle(area):
+    import hashlib
+    
+    areas = area_geometries(area)
+    lines = ["@prefix cvw: <" + WEIGHTS_NS + "> .", "@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .", ""]
+    done = set()
+    for relation in TRACT_RELATIONS:
+        tracts = tract_geometries(area, relation)
+        pairs = [(a, t) for a, t in tract_pairs(area, relation) if a in areas and t in tracts and (a, t) not in done]
+        done.update(pairs)
+        weights = CensusTools.overlap_weights(area, [t for a, t in pairs], [a for a, t in pairs],
+                                              [tracts[t][1] for a, t in pairs], [areas[a][1] for a, t in pairs]).tolist()
+        for (a, t), weight in zip(pairs, weights):
+            node = "urn:censusvis:weight:" + hashlib.blake2b((a + " " + t).encode("utf-8"), digest_size=16).hexdigest()
+            lines.append("<" + node + "> cvw:area <" + a + "> ; cvw:tract <" + t + "> ; cvw:weight \"" + repr(weight) + "\"^^xsd:double .")
+    return "\n".join(lines) + "\n"
+
+"""
+The export_weights function saves the overlap weights of the selected type of administrative
+area (see weights_turtle) as a Turtle file, e.g. to be loaded into the SPARQL endpoint's
+repository with its own tools (into the graph WEIGHTS_GRAPH + area, which server_sums reads)
+"""
+def export_weights(area, path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(weights_turtle(area))
+
+"""
+The upload_weights function uploads the overlap weights of the selected type of administrative
+area (see weights_turtle) to the SPARQL endpoint, replacing the graph WEIGHTS_GRAPH + area
+"""
+def upload_weights(area, endpoint=CensusQuery.ENDPOINT):
+    CensusQuery.upload(weights_turtle(area).encode("utf-8"), WEIGHTS_GRAPH + area, endpoint)
+
+"""
+The indicators_query function returns the SPARQL query that fetches the values of a group of
+indicators that are queried the same way (see query_indicators) in one query, listing the
+indicators (and the classes of their total, male and female populations, if they have values
+for the male/female population) in a VALUES block. Query for:
+    ?area: The administrative area
+    ?censustract: A census tract of the administrative area (only if relation is given)
+    ?characteristic: The indicator
+    ?value: The value of the indicator for the total population
+    ?valuemale, ?valuefemale: The values for the male/female population (only if hassexes is
+    True; like in query_values, only places that have all 3 values are returned)
+"""
+def indicators_query(area, characteristics, hassexes, relation=None):
+    if hassexes:
+        values = "VALUES (?characteristic ?person ?male ?female) {" + " ".join("(" + " ".join("<" + uri + ">" for uri in (c,) + indicator_classes(c)) + ")" for c in characteristics) + "}"
+    else:
+        values = "VALUES ?characteristic {" + " ".join("<" + c + ">" for c in characteristics) + "}"
+    
+    # The values are located in the administrative area itself, or in its census tracts
+    if relation is None:
+        location = "?area"
+        select = "?area ?characteristic ?value"
+        where = "?area a toronto:" + area + "."
+    else:
+        location = "?censustract"
+        select = "?area ?censustract ?characteristic ?value"
+        where = "?area a toronto:" + area + ";\n    " + relation + " ?censustract."
+    
+    if hassexes:
+        select += " ?valuemale ?valuefemale"
+        limat = """?limat a ?characteristic; 
+    uoft:hasLocation """ + location + """; 
+    iso21972:cardinality_of ?population; 
+    iso21972:value ?measure.
+    
+    ?population a ?populationclass. 
+    ?populationclass iso21972:defined_by ?person.
+    
+    ?limatmale a ?characteristic; 
+    uoft:hasLocation """ + location + """; 
+    iso21972:cardinality_of ?populationmale; 
+    iso21972:value ?measuremale.
+    
+    ?measuremale iso21972:numerical_value ?valuemale. 
+    
+    ?populationmale a ?populationclassmale. 
+    ?populationclassmale iso21972:defined_by ?male.
+    
+    ?limatfemale a ?characteristic; 
+    uoft:hasLocation """ + location + """; 
+    iso21972:cardinality_of ?populationfemale; 
+    iso21972:value ?measurefemale.
+    
+    ?measurefemale iso21972:numerical_value ?valuefemale. 
+    
+    ?populationfemale a ?populationclassfemale. 
+    ?populationclassfemale iso21972:defined_by ?female."""
+    else:
+        limat = """?limat a ?characteristic; 
+    ?p """ + location + """; 
+    iso21972:value ?measure."""
+    
+    return """
+    PREFIX uoft: <http://ontology.eil.utoronto.ca/tove/cacensus#>
+    PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
+    PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#> 
+    PREFIX iso5087m: <http://ontology.eil.utoronto.ca/5087/1/Mereology/>
+    SELECT DISTINCT """ + select + """
+    """ + ("FROM <http://www.ontotext.com/explicit>" if relation is None and not hassexes else "") + """
+    WHERE{
+    """ + values + """
+    
+    """ + where + """
+    
+    """ + limat + """
+    
+    ?measure iso21972:numerical_value ?value. 
+    } 
+    """
+
+"""
+The query_indicators function queries the values of many indicators for the selected type
+of administrative area and returns them as a wide Pandas DataFrame: one row for each area
+(indexed by area name) and one column for each indicator (named by its URI) holding the value
+for the total population. Areas without a value for an indicator are NaN. As in query_values,
+census tract values are apportioned to the areas when an indicator is not available for them
+directly, and a census tract whose total, male or female value is not a number counts as 0.
+
+The indicators are probed at the same time, then grouped by the way their values have to be
+queried (usually all of them are queried the same way); the values of each group are fetched
+with a single query (see indicators_query), and the geometries needed for apportioning are
+queried once for all of them. Raises ValueError if an indicator URI is invalid.
+"""
+def query_indicators(area, characteristics, progress=None, cancelled=None):
+    import pandas
+    
+    characteristics = list(dict.fromkeys(characteristics))
+    
+    checkpoint(progress, cancelled, "Checking the indicators...")
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        probes = list(pool.map(lambda characteristic: probe(area, characteristic), characteristics))
+    
+    # Groups the indicators by (hassexes, relation), where relation is None for values that are
+    # located in the administrative areas themselves
+    groups = {}
+    for characteristic, (hassexes, samearea, properpart) in zip(characteristics, probes):
+        if samearea:
+            relation = None
+        elif hassexes:
+            relation = "toronto:hasCensusTract"
+        elif properpart:
+            relation = "iso5087m:hasProperPart"
+        else:
+            relation = "iso5087m:properPartOf"
+        groups.setdefault((hassexes, relation), []).append(characteristic)
+    
+    # Query the area and census tract geometries on their own threads while the values are streamed
+    pool = ThreadPoolExecutor(max_workers=1 + len(groups))
+    areafuture = pool.submit(area_geometries, area)
+    tractfutures = {relation: pool.submit(tract_geometries, area, relation) for hassexes, relation in groups if relation is not None}
+    pool.shutdown(wait=False)
+    
+    # The value of each indicator (column) in each administrative area (row)
+    columns = {characteristic: {} for characteristic in characteristics}
+    
+    for (hassexes, relation), group in groups.items():
+        q = indicators_query(area, group, hassexes, relation)
+        
+        for bindings in CensusQuery.batches(CensusQuery.stream(q)):
+            checkpoint(progress, cancelled, "Querying the indicator values...")
+            areas = areafuture.result()
+            
+            # Values of administrative areas without a geometry are skipped, like in query_values
+            if relation is None:
+                for result in bindings:
+                    if result["area"].value in areas:
+                        areaname = areas[result["area"].value][0]
+                        try:
+                            value = float(result["value"].value)
+                        # If there's an error (due to no data), set value to 0
+                        except (KeyError, ValueError):
+                            value = 0
+                        columns[result["characteristic"].value][areaname] = value
+                continue
+            
+            # Joins each value to its administrative area and census tract, then apportions it
+            tracts = tractfutures[relation].result()
+            rows = []
+            for result in bindings:
+                if result["area"].value in areas and result["censustract"].value in tracts:
+                    areaname, areawkt = areas[result["area"].value]
+                    areaname2, censuswkt = tracts[result["censustract"].value]
+                    rows.append((result, areaname, areawkt, areaname2, censuswkt))
+            
+            multipliers = CensusTools.overlap_weights(area, [row[0]["censustract"].value for row in rows], [row[0]["area"].value for row in rows], [row[4] for row in rows], [row[2] for row in rows]).tolist()
+            
+            for (result, areaname, areawkt, areaname2, censuswkt), multiplier in zip(rows, multipliers):
+                column = columns[result["characteristic"].value]
+                try:
+                    value = float(result["value"].value)
+                    # The male/female values are checked too, so that the census tract counts the same as in query_values
+                    if hassexes:
+                        float(result["valuemale"].value) + float(result["valuefemale"].value)
+                # If there's an error (due to no data), set value to 0
+                except (KeyError, ValueError):
+                    value = 0
+                column[areaname] = column.get(areaname, 0) + multiplier * value
+        
+        # Round apportioned values to the nearest whole number, like in query_values
+        if relation is not None:
+            for characteristic in group:
+                columns[characteristic] = {areaname: round(value) for areaname, value in columns[characteristic].items()}
+    
+    df = pandas.DataFrame(columns, columns=characteristics)
+    df.index.name = "areaname"
+    return df.sort_index()
+
+# Suffix query_values adds to the names of areas whose values were apportioned from census tracts
+APPORTIONED_SUFFIX = "<br> <br>"
+
+# JavaScript function added to every map page. censusvis_restyle(update) applies an update
+# returned by restyle_data to the choropleth layer (LAYER is replaced by the layer's name):
+# the areas are recoloured, their popup box values and labels replaced and the legend redrawn.
+RESTYLE_SCRIPT = """
+    function censusvis_restyle(update) {
+        var layer = LAYER;
+        var key = function(feature) {
+            return String(feature.properties.areaname).replace(/<br> <br>$/, "");
+        };
+        var style = function(feature) {
+            return update.styles[key(feature)] || update.missing;
+        };
+        layer.eachLayer(function(l) {
+            var properties = update.properties[key(l.feature)] || {};
+            update.fields.forEach(function(field) {
+                if (field != "areaname") {
+                    l.feature.properties[field] = field in properties ? properties[field] : null;
+                }
+            });
+            if ("areaname" in properties) {
+                l.feature.properties.areaname = properties.areaname;
+            }
+        });
+        layer.options.style = style;
+        layer.setStyle(style);
+        layer.unbindTooltip();
+        layer.bindTooltip(function(l) {
+            var div = L.DomUtil.create("div");
+            div.innerHTML = "<table>" + update.fields.map(function(field, i) {
+                var value = l.feature.properties[field];
+                return "<tr><th>" + update.aliases[i] + "</th><td>" + (value === null || value === undefined ? "" : value.toLocaleString()) + "</td></tr>";
+            }).join("") + "</table>";
+            return div;
+        }, {"maxWidth": 300, "sticky": false, "className": "foliumtooltip"});
+        var legend = document.querySelector(".legend.leaflet-control");
+        if (legend) {
+            legend.innerHTML = update.legend;
+        }
+    }
+"""
+
+"""
+The _areakey function returns the name of an area without the suffix query_values adds to
+apportioned areas, so that an area has the same key whichever way its values were calculated
+"""
+def _areakey(areaname):
+    return areaname[:-len(APPORTIONED_SUFFIX)] if areaname.endswith(APPORTIONED_SUFFIX) else areaname
+
+"""
+The _choropleth function creates the choropleth layer of a visualization (coloured by the
+sumvalue column of df) without adding it to a map
+"""
+def _choropleth(geo_data, df, indicator, topojson=False):
+    import folium
+    
+    # Create a colour scale based on the indicator values from the data in the Pandas DataFrame
+    custom_scale = (df["sumvalue"].quantile((0,0.2,0.4,0.6,0.8,1))).tolist()
+
+    # Create a choropleth layer using the data in the GeoJSON and Pandas DataFrame
+    return folium.Choropleth(
+        # Use geo data from the geoj GeoJSON variable (or its TopoJSON encoding) for the choropleth layer
+        geo_data=geo_data,
+        topojson="objects.areas" if topojson else None,
+        # Use the display name entered by the user as the name of the choropleth layer
+        name=indicator,
+        # Use data from the df Pandas DataFrame for the choropleth layer
+        data=df,
+        # Create polygons of the administrative areas and color them according to their sumvalue
+        columns=["areaname", "sumvalue"],
+        key_on="feature.properties.areaname",
+        # Use the custom_scale color scale for coloring the visualization
+        threshold_scale=custom_scale, 
+        # Color the visualization using yellow, orange, and red
+        fill_color='YlOrRd',
+        # Use the color white if the value of the indicator is 0
+        nan_fill_color="White",
+        # Set the opacity of the polygons
+        fill_opacity=0.7,
+        # Set the opacity of the polygon outlines
+        line_opacity=0.2,
+        # Use the display name entered by the user for the color legend in the top right of the visualization
+        legend_name=indicator,
+        # Highlight if polygon is selected
+        highlight=True,
+        # Set smooth factor to 2. More means better performance and smoother look, and less means more accurate representation.
+        smooth_factor=2,
+        # Set polygon outline color to black
+        line_color='black'
+        )
+
+"""
+The _tooltip_fields function returns the fields and the labels (aliases) of the popup boxes
+of a visualization
+"""
+def _tooltip_fields(area, indicator, hassexes, samearea):
+    # If values for male/female population exist, create popup boxes that show the 
+    # administrative area name and the total, male, female values for the indicator
+    if hassexes:
+        # Use areaname, sumvalue, sumvaluemale, sumvaluefemale from geoj as values for the popup box
+        fields = ['areaname', 'sumvalue', 'sumvaluemale', 'sumvaluefemale']
+        # Use the administrative area type and the display name entered by the user as labels for the above values
+        aliases = [area, indicator + " (Total)", indicator + " (Male)", indicator + " (Female)"]
+    # Else, create popup boxes showing the administrative area name and the value for the indicator
+    else:
+        # Use areaname, sumvalue from geoj as values for the popup box
+        fields = ['areaname', 'sumvalue']
+        # Use the administrative area type and the display name entered by the user as labels for the above values
+        aliases = [area, indicator]
+    
+    # If the values were apportioned from census tracts, also show the census tracts used for the calculation
+    if not samearea:
+        fields.append('multiplier')
+        aliases[0] = area + "<br> <br>"
+        aliases.append("Administrative areas used for calculation")
+    
+    return fields, aliases
+
+"""
+The render_map function creates the folium map of the visualization from the features and
+values returned by query_values: a choropleth layer coloured by the indicator values with
+popup boxes. Unless simplify is False, the polygons are simplified (preserving their topology)
+and their coordinates rounded to the detail visible at RENDER_ZOOM. If topojson is True, the
+areas are embedded as TopoJSON, which stores the boundaries shared by neighbouring areas once
+(the map is smaller, but areas are not highlighted on hover). Returns the folium map.
+"""
+def render_map(geoj, df, area, indicator, hassexes, samearea, simplify=True, topojson=False):
+    import folium
+    
+    tolerance = CensusTools.zoom_tolerance(RENDER_ZOOM) if simplify else None
+    if topojson:
+        # Encode the areas as TopoJSON, simplifying the shared boundaries rather than each polygon
+        geo_data = CensusTools.topology(geoj, "areas", TOPOJSON_QUANTIZATION, tolerance)
+    elif simplify:
+        # Simplify the polygons and round their coordinates to what is visible at RENDER_ZOOM
+        geo_data = CensusTools.simplify_features(geoj, tolerance, COORDINATE_DIGITS)
+    else:
+        geo_data = geoj
+    
+    # Create a folium map centered at the location specified by the coordinates
+    m = folium.Map(location=[43.6581,-79.3845], zoom_start=12)
+
+    # Create a choropleth layer using the data in the GeoJSON and Pandas DataFrame and add it to the folium map
+    choro = _choropleth(geo_data, df, indicator, topojson).add_to(m)
+
+    # Attach the popup boxes to the choropleth layer's own GeoJSON, so that the geometry is only embedded once
+    fields, aliases = _tooltip_fields(area, indicator, hassexes, samearea)
+    folium.features.GeoJsonTooltip(
+        fields=fields,
+        aliases=aliases,
+        # Use JavaScript’s .toLocaleString() to format values (i.e. comma separators, float truncation)
+        localize=True,
+        # Use to set whether the popup box follows the mouse cursor
+        sticky=False,
+        # Use to toggle whether to show the labels and values
+        labels=True,
+        # Set max width of the popup box
+        max_width=300
+        ).add_to(choro.geojson)
+    
+    # Add the function that restyles the map in place (see restyle_data)
+    m.get_root().script.add_child(folium.Element(RESTYLE_SCRIPT.replace("LAYER", choro.geojson.get_name())))
+            
+    # Add a LayerControl to the map which adds a toggle for showing/hiding the choropleth layer
+    folium.LayerControl().add_to(m)
+    
+    return m
+
+# JavaScript that builds the layers of a multi-indicator map (see render_multi_map) from one
+# embedded GeoJSON payload. It is a Jinja template of the element that render_multi_map adds:
+# this.data is the data, this.indicators the list of indicators (each with the name of the
+# feature group its layer is added to), this.groups maps those names to the feature groups and
+# this.map is the map's name. Jinja inserts the values as they are, once.
+MULTI_SCRIPT = """
+    var censusvis_data = {{ this.data }};
+    var censusvis_indicators = {{ this.indicators }};
+    var censusvis_groups = {{ this.groups }};
+    censusvis_indicators.forEach(function(indicator) {
+        indicator.group = censusvis_groups[indicator.group];
+    });
+    var censusvis_legend = L.control({position: "topright"});
+    censusvis_legend.onAdd = function(map) {
+        return L.DomUtil.create("div", "legend");
+    };
+    censusvis_legend.addTo({{ this.map }});
+    censusvis_indicators.forEach(function(indicator) {
+        var color = function(value) {
+            if (value !== null && value !== undefined) {
+                for (var i = indicator.edges.length - 2; i >= 0; i--) {
+                    if (value >= indicator.edges[i]) {
+                        return indicator.colors[i];
+                    }
+                }
+            }
+            return "White";
+        };
+        var style = function(feature) {
+            return {"weight": 1, "opacity": 0.2, "color": "black", "fillOpacity": 0.7, "fillColor": color(feature.properties[indicator.field])};
+        };
+        var layer = L.geoJson(censusvis_data, {
+            smoothFactor: 2,
+            style: style,
+            onEachFeature: function(feature, l) {
+                l.on({
+                    mouseover: function(e) { e.target.setStyle({"weight": 3, "fillOpacity": 0.9}); },
+                    mouseout: function(e) { layer.resetStyle(e.target); }
+                });
+            }
+        });
+        layer.bindTooltip(function(l) {
+            var value = l.feature.properties[indicator.field];
+            return "<table><tr><th>" + indicator.area + "</th><td>" + l.feature.properties.areaname + "</td></tr><tr><th>"
+                + indicator.name + "</th><td>" + (value === null || value === undefined ? "" : value.toLocaleString()) + "</td></tr></table>";
+        }, {"maxWidth": 300, "sticky": false});
+        layer.addTo(indicator.group);
+    });
+    var censusvis_showlegend = function(group) {
+        censusvis_indicators.forEach(function(indicator) {
+            if (indicator.group !== group) {
+                return;
+            }
+            var html = "<div style='background: white; padding: 4px 8px'><b>" + indicator.name + "</b><br>";
+            indicator.colors.forEach(function(color, i) {
+                if (i < indicator.edges.length - 1) {
+                    html += "<span style='display: inline-block; width: 70px; border-top: 10px solid " + color + "'>" + indicator.edges[i].toLocaleString() + "</span>";
+                }
+            });
+            if (indicator.edges.length) {
+                html += "<span style='display: inline-block; border-top: 10px solid transparent'>" + indicator.edges[indicator.edges.length - 1].toLocaleString() + "</span>";
+            }
+            censusvis_legend.getContainer().innerHTML = html + "</div>";
+        });
+    };
+    {{ this.map }}.on("baselayerchange", function(e) { censusvis_showlegend(e.layer); });
+    censusvis_showlegend(censusvis_indicators[0].group);
+"""
+
+"""
+The restyle_data function returns the update that recolours a map already showing the areas
+of geoj for new values (passed to censusvis_restyle in the map page, see RESTYLE_SCRIPT).
+It is a dictionary that can be converted to JSON:
+    fields, aliases: the fields and labels of the popup boxes
+    styles: the style of every area, keyed by area name
+    missing: the style of areas on the map that have no value
+    properties: the popup box values of every area, keyed by area name
+    legend: the SVG of the colour legend
+The colours are calculated by the same choropleth layer that render_map uses.
+"""
+def restyle_data(geoj, df, area, indicator, hassexes, samearea):
+    # The choropleth layer only needs the properties of the areas to colour them
+    features = [{"type": "Feature", "geometry": None, "properties": feature["properties"]} for feature in geoj["features"]]
+    choro = _choropleth({"type": "FeatureCollection", "features": features}, df, indicator)
+    style = choro.geojson.style_function
+    
+    fields, aliases = _tooltip_fields(area, indicator, hassexes, samearea)
+    return {
+        "fields": fields,
+        "aliases": aliases,
+        "styles": {_areakey(feature["properties"]["areaname"]): style(feature) for feature in features},
+        "missing": style({"properties": {"areaname": ""}}),
+        "properties": {_areakey(feature["properties"]["areaname"]): dict(feature["properties"]) for feature in features},
+        "legend": choro.color_scale._repr_html_(),
+    }
+
+"""
+The _scriptjson function returns value as JSON that can be embedded in a map's script. folium
+renders the script as a Jinja template once more and the browser ends the script at "</", so
+"{{", "{%", "{#" and "<" are escaped (in JSON they can only occur inside strings).
+"""
+def _scriptjson(value):
+    import json
+    import re
+    
+    return re.sub(r"\{(?=[{%#])", r"\\u007b", json.dumps(value)).replace("<", "\\u003c")
+
+"""
+The render_multi_map function creates the folium map of a multi-indicator visualization from
+a wide DataFrame of values returned by query_indicators (one column for each indicator) and
+the geometries of the areas returned by area_geometries. indicators are the display names of
+the columns. The geometry of the areas is embedded once, with the value of every indicator as
+a property (v0, v1, ...) of each area, and each indicator gets its own layer (coloured the same
+way as render_map colours a single indicator) that is built from it in the page. Only one
+indicator layer is shown at a time; it is selected with the LayerControl, and the legend
+(drawn in the page from the colour scale) follows it. Returns the folium map.
+"""
+def render_multi_map(df, geometries, area, indicators, simplify=True):
+    import folium
+    import json
+    import math
+    
+    from branca.utilities import color_brewer
+    from jinja2 import Template
+    
+    # The geometry of every area that has a value, with the values of all the indicators as properties
+    wkts = {name: wkt for name, wkt in geometries.values()}
+    geoj = {"type": "FeatureCollection", "features": []}
+    for areaname, row in df.iterrows():
+        if areaname in wkts:
+            properties = {"areaname": areaname}
+            for i, value in enumerate(row.tolist()):
+                properties["v" + str(i)] = None if value is None or math.isnan(value) else value
+            geoj["features"].append(geojson.Feature(geometry=CensusTools.wkttopoly(wkts[areaname]), properties=properties))
+    
+    if simplify:
+        geoj = CensusTools.simplify_features(geoj, CensusTools.zoom_tolerance(RENDER_ZOOM), COORDINATE_DIGITS)
+    
+    # Create a folium map centered at the location specified by the coordinates. The tiles are an
+    # overlay without a toggle, so that the indicator layers are the only choices in the LayerControl.
+    m = folium.Map(location=[43.6581,-79.3845], zoom_start=12, tiles=None)
+    folium.TileLayer("OpenStreetMap", overlay=True, control=False).add_to(m)
+    
+    # Create an empty feature group for every indicator and its colour scale (the same quantiles as render_map)
+    layers = []
+    for i, (column, indicator) in enumerate(zip(df.columns, indicators)):
+        group = folium.FeatureGroup(name=indicator, overlay=False, show=(i == 0)).add_to(m)
+        values = df[column].dropna()
+        edges = values.quantile((0,0.2,0.4,0.6,0.8,1)).tolist() if len(values) else []
+        layers.append((group.get_name(), {"field": "v" + str(i), "name": indicator, "area": area, "edges": edges, "colors": color_brewer('YlOrRd', n=5)}))
+    
+    # Build the layers in the page from the shared data (the feature groups are referenced by name)
+    element = folium.MacroElement()
+    element._template = Template("{% macro script(this, kwargs) %}" + MULTI_SCRIPT + "{% endmacro %}")
+    element.data = _scriptjson(geoj)
+    element.indicators = _scriptjson([{**layer, "group": name} for name, layer in layers])
+    element.groups = "{" + ", ".join(json.dumps(name) + ": " + name for name, layer in layers) + "}"
+    element.map = m.get_name()
+    element.add_to(m)
+    
+    # Add a LayerControl to the map for switching between the indicators
+    folium.LayerControl(collapsed=False).add_to(m)
+    
+    return m
+
+"""
+The memory_usage function returns the resident memory of the process in bytes, or None if it
+cannot be measured on this platform
+"""
+def memory_usage():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Falls back to the peak resident memory (in kilobytes on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+"""
+The save_html function saves the HTML of a visualization as filename.html. If trace is not
+None, the save is recorded in it as the save_html stage.
+"""
+def save_html(filename, html, progress=None, cancelled=None, trace=None):
+    checkpoint(progress, cancelled, "Saving the map...")
+    with CensusTrace.stage(trace, "save_html") as values:
+        data = html.encode("utf-8")
+        with open(filename + ".html", "wb") as f:
+            f.write(data)
+        values["bytes"] = len(data)
+
+"""
+The run_generate function queries the SPARQL endpoint for the values of the indicator in the
+selected type of administrative area and generates the visualization. The map is rendered
+to HTML in memory and its HTML is returned; unless save is False, it is also saved as
+filename.html. If a report dictionary is given, it is filled with the memory usage of the run:
+    features: the number of areas on the map
+    areas: the names of the areas on the map (used by run_restyle)
+    html_bytes: the size of the generated HTML
+    memory_before, memory_peak, memory_after: the resident memory of the process (in bytes)
+    before the run, after rendering and after the run's features have been released
+    trace: the CensusTrace.Trace the stages of the run are recorded in (probe, query_values
+    and its stages, render_map, render_html and save_html). A trace already in the report
+    is recorded in instead of a new one.
+If topojson is True, the map is embedded as TopoJSON (see render_map). If serverside is True,
+apportioned values are summed by the SPARQL endpoint (see query_values).
+"""
+def run_generate(area, characteristic, indicator, filename, report=None, progress=None, cancelled=None, topojson=False, save=True, serverside=False):
+    if report is None:
+        report = {}
+    report["memory_before"] = memory_usage()
+    trace = report.setdefault("trace", CensusTrace.Trace("generate"))
+    
+    checkpoint(progress, cancelled, "Checking the indicator...")
+    with trace.stage("probe"):
+        hassexes, samearea, properpart = probe(area, characteristic)
+    
+    checkpoint(progress, cancelled, "Querying the indicator values...")
+    with trace.stage("query_values") as values:
+        geoj, df = query_values(area, characteristic, hassexes, samearea, properpart, progress, cancelled, serverside, trace)
+        values["features"] = len(geoj["features"])
+    report["features"] = len(geoj["features"])
+    report["areas"] = set(_areakey(feature["properties"]["areaname"]) for feature in geoj["features"])
+    
+    checkpoint(progress, cancelled, "Rendering the map...")
+    with trace.stage("render_map"):
+        m = render_map(geoj, df, area, indicator, hassexes, samearea, topojson=topojson)
+    with trace.stage("render_html") as values:
+        html = m.get_root().render()
+        values["bytes"] = len(html.encode("utf-8"))
+    report["memory_peak"] = memory_usage()
+    
+    # The features, values and map of this run are not needed anymore
+    del geoj, df, m
+    
+    # Save the visualization map using the file name specified by the user
+    if save:
+        save_html(filename, html, progress, cancelled, trace)
+    
+    report["html_bytes"] = len(html.encode("utf-8"))
+    report["memory_after"] = memory_usage()
+    return html
+
+"""
+The run_restyle function queries the SPARQL endpoint for the values of the indicator in the
+selected type of administrative area and returns the update (see restyle_data) that recolours
+a map of the same area type already showing the areas in shown, instead of generating a new
+visualization. Returns None if some of the areas with values are not on the shown map (the
+visualization then has to be generated with run_generate). If a report dictionary is given,
+its features entry is set to the number of areas with values, and its trace entry to the
+stages of the run (as in run_generate).
+"""
+def run_restyle(area, characteristic, indicator, shown, report=None, progress=None, cancelled=None):
+    if report is None:
+        report = {}
+    trace = report.setdefault("trace", CensusTrace.Trace("restyle"))
+    
+    checkpoint(progress, cancelled, "Checking the indicator...")
+    with trace.stage("probe"):
+        hassexes, samearea, properpart = probe(area, characteristic)
+    
+    checkpoint(progress, cancelled, "Querying the indicator values...")
+    with trace.stage("query_values") as values:
+        geoj, df = query_values(area, characteristic, hassexes, samearea, properpart, progress, cancelled, trace=trace)
+        values["features"] = len(geoj["features"])
+    report["features"] = len(geoj["features"])
+    
+    if not set(_areakey(feature["properties"]["areaname"]) for feature in geoj["features"]) <= shown:
+        return None
+    
+    checkpoint(progress, cancelled, "Updating the map...")
+    with trace.stage("restyle_data"):
+        return restyle_data(geoj, df, area, indicator, hassexes, samearea)
+
+"""
+The run_generate_multi function queries the SPARQL endpoint for the values of many indicators
+(characteristics, shown with the display names in indicators) in the selected type of
+administrative area and generates a multi-indicator visualization (see render_multi_map),
+returning its HTML. Unless save is False, it is also saved as filename.html. If a report
+dictionary is given, it is filled like the one of run_generate.
+"""
+def run_generate_multi(area, characteristics, indicators, filename, report=None, progress=None, cancelled=None, save=True):
+    if report is None:
+        report = {}
+    report["memory_before"] = memory_usage()
+    
+    if len(characteristics) != len(indicators):
+        raise ValueError("Sorry, every indicator needs a display name.")
+    trace = report.setdefault("trace", CensusTrace.Trace("generate_multi"))
+    
+    with trace.stage("query_indicators") as values:
+        df = query_indicators(area, characteristics, progress, cancelled)
+        values["rows"] = len(df)
+    geometries = traced(trace, "area_geometries", area_geometries, area)
+    report["features"] = len(df)
+    report["areas"] = set(df.index)
+    
+    checkpoint(progress, cancelled, "Rendering the map...")
+    names = dict(zip(characteristics, indicators))
+    with trace.stage("render_map"):
+        m = render_multi_map(df, geometries, area, [names[column] for column in df.columns])
+    with trace.stage("render_html") as values:
+        html = m.get_root().render()
+        values["bytes"] = len(html.encode("utf-8"))
+    report["memory_peak"] = memory_usage()
+    
+    # The values and map of this run are not needed anymore
+    del df, geometries, m
+    
+    if save:
+        save_html(filename, html, progress, cancelled, trace)
+    
+    report["html_bytes"] = len(html.encode("utf-8"))
+    report["memory_after"] = memory_usage()
+    return html
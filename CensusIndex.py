@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+CensusIndex.py
+
+Author: Anderson Wong
+
+Date: October 17, 2026
+
+Description: This is a Python module that searches the indicator catalog of the census
+SPARQL endpoint locally, using a full-text (inverted) index of the URI and description
+(rdfs:comment) of every indicator:
+
+    1. tokenize(text): a function that splits a description or a URI into lowercase words
+
+    2. SearchIndex(documents): a class that indexes a list of [indicator URI, description]
+    pairs. Its search(search) method returns the indicators that contain every search
+    term (the terms may be the beginnings of words), best matches first. A search can be
+    narrowed to the results of a previous search (e.g. while the search is being typed).
+
+    3. fetch_catalog(): a function that queries the endpoint for every indicator
+
+    4. catalog_index(refresh): a function that returns the index of the catalog, loading it
+    from disk or building (and saving) it from one bulk query when needed
+
+The index is saved in INDEX_DIR (one file for each endpoint) and rebuilt when it is older
+than INDEX_TTL, so that searches answer in milliseconds without contacting the endpoint.
+"""
+
+import bisect
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+import CensusQuery
+
+from collections import OrderedDict
+
+# Directory, format version and time to live (in seconds) of the saved catalog indexes
+INDEX_DIR = os.path.join(os.path.expanduser("~"), ".censusvis", "index")
+INDEX_VERSION = 1
+INDEX_TTL = 7 * 24 * 60 * 60
+
+# BM25 ranking parameters, and the factor the score of a word that only begins with a search term is multiplied by
+BM25_K1 = 1.2
+BM25_B = 0.75
+PREFIX_FACTOR = 0.5
+
+# Number of searched terms whose scores each index keeps
+RECENT_TERMS = 32
+
+# Matches the words of a description, and the boundaries between the words of a camel case URI name
+_words = re.compile(r"[a-z0-9]+")
+_camelcase = re.compile(r"(?<=[a-z])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])|(?<=[A-Za-z])(?=[0-9])|(?<=[0-9])(?=[A-Za-z])")
+
+# Loaded catalog indexes keyed by endpoint
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+"""
+The tokenize function returns the lowercase words of a text (runs of letters and digits)
+"""
+def tokenize(text):
+    return _words.findall(text.lower())
+
+"""
+The _uriwords function returns the words of the name of a URI (the part after the last # or /),
+splitting camel case names such as PersonIncome2016 into person, income, 2016. The whole name
+(personincome2016) is also returned, so that a name can be searched for as it is written.
+"""
+def _uriwords(uri):
+    name = re.split(r"[#/]", uri)[-1]
+    words = tokenize(_camelcase.sub(" ", name))
+    whole = "".join(tokenize(name))
+    return words + [whole] if len(words) > 1 else words
+
+"""
+A SearchIndex is an inverted index of a list of [indicator URI, description] pairs. Each word
+of a description or URI name maps to the indicators that contain it and how many times.
+Searches rank the indicators with BM25 and only read the postings of the searched words.
+"""
+class SearchIndex:
+    def __init__(self, documents, postings=None, lengths=None):
+        self.documents = [[uri, comment] for uri, comment in documents]
+
+        # Builds the postings (word -> [[document, count], ...]) unless they were loaded from disk
+        if postings is None:
+            postings = {}
+            lengths = []
+            for i, (uri, comment) in enumerate(self.documents):
+                words = tokenize(comment) + _uriwords(uri)
+                counts = {}
+                for word in words:
+                    counts[word] = counts.get(word, 0) + 1
+                for word, count in counts.items():
+                    postings.setdefault(word, []).append([i, count])
+                lengths.append(len(words))
+
+        self.postings = postings
+        self.lengths = lengths
+        self.vocabulary = sorted(postings)
+        self.average = sum(lengths) / len(lengths) if lengths else 0.0
+
+        # Index of each [indicator URI, description] pair, and the words of each indicator and its
+        # description as lowercase words separated by spaces (both built when first needed)
+        self.ids = {(uri, comment): i for i, (uri, comment) in enumerate(self.documents)}
+        self.forward = None
+        self.phrases = None
+
+        # Scores of the most recently searched terms (see _scores), so that the terms that are not
+        # being typed are not scored again while a search is typed
+        self.recent = OrderedDict()
+
+        # Lock that searches on different threads hold while they build or update the above
+        self.lock = threading.Lock()
+
+    """
+    The _expand method returns the words of the index that begin with term, with the factor their
+    score is multiplied by (1 for the term itself, PREFIX_FACTOR for longer words)
+    """
+    def _expand(self, term):
+        words = []
+        for i in range(bisect.bisect_left(self.vocabulary, term), len(self.vocabulary)):
+            word = self.vocabulary[i]
+            if not word.startswith(term):
+                break
+            words.append((word, 1.0 if word == term else PREFIX_FACTOR))
+        return words
+
+    """
+    The _score method returns the BM25 score of a word that occurs frequency times in indicator i
+    """
+    def _score(self, word, factor, frequency, i):
+        matches = len(self.postings[word])
+        idf = math.log(1 + (len(self.documents) - matches + 0.5) / (matches + 0.5))
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / self.average)
+        return factor * idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+    """
+    The _scores method returns the BM25 score of every indicator that contains a word beginning
+    with term (a dictionary that maps the index of the indicator to its score). If candidates
+    (a set of indicator indexes) is not None, only those indicators are scored; when they are
+    fewer than the postings of the term, their own words are read instead of the postings.
+    """
+    def _scores(self, term, candidates=None):
+        scores = {}
+        words = self._expand(term)
+
+        if candidates is not None and len(candidates) < sum(len(self.postings[word]) for word, factor in words):
+            # Reads the words of each candidate (the forward index is built from the postings once)
+            if self.forward is None:
+                self.forward = [{} for document in self.documents]
+                for word, postings in self.postings.items():
+                    for i, frequency in postings:
+                        self.forward[i][word] = frequency
+            for i in candidates:
+                for word, frequency in self.forward[i].items():
+                    if word.startswith(term):
+                        score = self._score(word, 1.0 if word == term else PREFIX_FACTOR, frequency, i)
+                        if score > scores.get(i, 0.0):
+                            scores[i] = score
+            return scores
+
+        for word, factor in words:
+            for i, frequency in self.postings[word]:
+                if candidates is not None and i not in candidates:
+                    continue
+                score = self._score(word, factor, frequency, i)
+                # An indicator counts each search term once, for its best matching word
+                if score > scores.get(i, 0.0):
+                    scores[i] = score
+        return scores
+
+    """
+    The _termscores method returns the scores of a term (see _scores), reusing the scores of
+    the RECENT_TERMS most recently searched terms. Only the scores of every indicator are kept
+    (reused scores are narrowed to the candidates).
+    """
+    def _termscores(self, term, candidates=None):
+        with self.lock:
+            scores = self.recent.get(term)
+            if scores is not None:
+                self.recent.move_to_end(term)
+                if candidates is not None:
+                    return {i: score for i, score in scores.items() if i in candidates}
+                return scores
+
+            scores = self._scores(term, candidates)
+            if candidates is None:
+                self.recent[term] = scores
+                if len(self.recent) > RECENT_TERMS:
+                    self.recent.popitem(last=False)
+            return scores
+
+    """
+    The search method returns the indicators that contain every term of search (each term may be
+    the whole or the beginning of a word) as a list of [indicator URI, description] pairs, best
+    matches first. Indicators whose description contains the search text as it was typed are
+    ranked above the others. An empty search returns every indicator. At most limit results are
+    returned if limit is not None. If within is not None, only the indicators in it (the results
+    of a previous search) are searched.
+    """
+    def search(self, search, limit=None, within=None):
+        candidates = None
+        if within is not None:
+            candidates = {self.ids[(uri, comment)] for uri, comment in within if (uri, comment) in self.ids}
+
+        terms = list(dict.fromkeys(tokenize(search)))
+        if not terms:
+            if candidates is not None:
+                return [self.documents[i] for i in sorted(candidates)][:limit]
+            return self.documents[:limit]
+
+        # Intersects the indicators of the terms, starting with the term that matches the fewest
+        total = None
+        for scores in sorted((self._termscores(term, candidates) for term in terms), key=len):
+            if total is None:
+                total = scores
+            else:
+                total = {i: score + scores[i] for i, score in total.items() if i in scores}
+            if not total:
+                return []
+
+        # Ranks exact phrase matches first, then by score (ties keep the order of the catalog)
+        with self.lock:
+            if self.phrases is None:
+                self.phrases = [" ".join(tokenize(comment)) for uri, comment in self.documents]
+        phrase = " ".join(terms)
+        ranked = sorted(total, key=lambda i: (phrase not in self.phrases[i], -total[i], i))
+        return [self.documents[i] for i in ranked[:limit]]
+
+    """
+    The save method writes the index to a gzip compressed JSON file. The file is replaced
+    atomically so that readers never see a partially written index.
+    """
+    def save(self, path, endpoint=""):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {"version": INDEX_VERSION, "endpoint": endpoint, "documents": self.documents,
+                "postings": self.postings, "lengths": self.lengths}
+        handle, temp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".")
+        try:
+            with gzip.open(os.fdopen(handle, "wb"), "wt", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(temp, path)
+        except BaseException:
+            os.remove(temp)
+            raise
+
+    """
+    The load class method reads an index written by save. Returns None if the file does not
+    exist, cannot be read or was written by another version of this module.
+    """
+    @classmethod
+    def load(cls, path):
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_VERSION:
+                return None
+            return cls(data["documents"], data["postings"], data["lengths"])
+        except (OSError, ValueError, KeyError, TypeError, EOFError):
+            return None
+
+"""
+The _indexpath function returns the path of the saved catalog index of an endpoint
+"""
+def _indexpath(endpoint):
+    return os.path.join(INDEX_DIR, hashlib.sha256(endpoint.encode("utf-8")).hexdigest()[:32] + ".json.gz")
+
+"""
+The fetch_catalog function queries the endpoint for the URI and description of every indicator.
+Returns them as a list of [indicator URI, description] pairs.
+"""
+def fetch_catalog(endpoint=CensusQuery.ENDPOINT):
+    q = """
+    PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#>
+    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+
+    SELECT DISTINCT ?class ?comment
+
+    WHERE{
+        ?class rdfs:subClassOf iso21972:Indicator;
+        rdfs:comment ?comment
+    }
+    """
+    return [[result["class"].value, result["comment"].value] for result in CensusQuery.stream(q, endpoint) if "class" in result and "comment" in result]
+
+"""
+The catalog_index function returns the SearchIndex of the indicator catalog of the endpoint.
+The index is kept in memory once it has been loaded. It is loaded from disk if it has been
+saved less than INDEX_TTL seconds ago, otherwise it is built from fetch_catalog and saved.
+If refresh is True, the index is always rebuilt.
+"""
+def catalog_index(refresh=False, endpoint=CensusQuery.ENDPOINT):
+    with _indexes_lock:
+        if not refresh and endpoint in _indexes:
+            return _indexes[endpoint]
+
+        path = _indexpath(endpoint)
+        index = None
+        if not refresh:
+            try:
+                fresh = time.time() - os.path.getmtime(path) < INDEX_TTL
+            except OSError:
+                fresh = False
+            if fresh:
+                index = SearchIndex.load(path)
+
+        if index is None:
+            index = SearchIndex(fetch_catalog(endpoint))
+            index.save(path, endpoint)
+
+        _indexes[endpoint] = index
+        return index
@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+"""
+CensusQuery.py
+
+Author: Anderson Wong
+
+Date: October 17, 2026
+
+Description: This is a Python module that sends queries to the census SPARQL endpoint
+and keeps their responses in a local on-disk cache:
+
+    1. ask(q): a function that runs a SPARQL ASK query and returns its JSON result
+
+    2. bindings(q): a function that runs a SPARQL SELECT query and returns its rows in
+    the same format as SPARQLWrapper2's query().bindings
+
+    3. dataframe(q): a function that runs a SPARQL SELECT query and returns its results
+    as a Pandas DataFrame, the same as sparql_dataframe.get
+
+    4. stream(q): a function that runs a SPARQL SELECT query and yields its rows (in the
+    same format as bindings) while the CSV response is still being downloaded
+
+    5. batches(rows, size): a function that reads rows on a background thread and yields
+    them in lists of at most size rows, so that rows can be processed during the download
+
+    6. configure(...): a function that changes the cache directory, time to live, size
+    limit and replay mode
+
+    7. clear_cache(): a function that removes every cached response
+
+    8. upload(content, context): a function that replaces a named graph of the endpoint's
+    repository with RDF in the Turtle format
+
+    9. counters(): a function that returns how many queries were run and answered from the
+    cache, how many bytes were received or read from the cache, and how long the endpoint
+    was waited for
+
+Responses are cached by the hash of the endpoint and the normalized query text. Cached
+responses are reused until they are older than the time to live, and the oldest responses
+are evicted when the cache grows over its size limit. In replay mode the endpoint is never
+contacted; every query must be answered from the cache (e.g. a recorded fixture directory),
+otherwise CacheMiss is raised. Replay mode and the cache directory can also be set with the
+CENSUSVIS_REPLAY and CENSUSVIS_CACHE_DIR environment variables.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+from io import StringIO
+from SPARQLWrapper import SPARQLWrapper, JSON, CSV
+from SPARQLWrapper.SmartWrapper import Value
+
+# The Canadian Census GraphDB SPARQL endpoint
+ENDPOINT = "http://ec2-3-97-59-180.ca-central-1.compute.amazonaws.com:7200/repositories/CACensus"
+
+# Default cache settings
+CACHE_DIR = os.environ.get("CENSUSVIS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".censusvis", "queries"))
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+_settings = {
+    "directory": CACHE_DIR,
+    "ttl": DEFAULT_TTL,
+    "max_bytes": DEFAULT_CACHE_BYTES,
+    "replay": os.environ.get("CENSUSVIS_REPLAY", "") not in ("", "0"),
+    "enabled": True,
+}
+
+# Running totals returned by counters
+_counters = {"queries": 0, "cache_hits": 0, "bytes_received": 0, "bytes_cached": 0, "query_seconds": 0.0}
+_counters_lock = threading.Lock()
+
+# Matches string literals and IRIs (which are kept as they are) or runs of whitespace
+_tokens = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|<[^<>\s]*>)|\s+')
+
+# Raised in replay mode when a query has no cached response
+class CacheMiss(LookupError):
+    pass
+
+"""
+The configure function changes the cache settings. Arguments that are None are left as they are.
+    directory: the directory the responses are cached in
+    ttl: how many seconds a cached response is reused for (None keeps the setting, 0 disables reuse)
+    max_bytes: the size limit of the cache in bytes
+    replay: if True, queries are only answered from the cache and never sent to the endpoint
+    enabled: if False, responses are neither read from nor written to the cache
+"""
+def configure(directory=None, ttl=None, max_bytes=None, replay=None, enabled=None):
+    for name, value in (("directory", directory), ("ttl", ttl), ("max_bytes", max_bytes), ("replay", replay), ("enabled", enabled)):
+        if value is not None:
+            _settings[name] = value
+
+"""
+The _count function adds values to the running totals of counters
+"""
+def _count(**values):
+    with _counters_lock:
+        for name, value in values.items():
+            _counters[name] += value
+
+"""
+The counters function returns a copy of the running totals of the queries of this process:
+    queries: the number of queries run
+    cache_hits: the number of queries answered from the cache
+    bytes_received, bytes_cached: the bytes of the responses received from the endpoint and read from the cache
+    query_seconds: the time spent waiting for the endpoint (summed over threads)
+"""
+def counters():
+    with _counters_lock:
+        return dict(_counters)
+
+"""
+The normalize function returns a query with its whitespace collapsed, so that queries that
+only differ in indentation share a cache entry. String literals and IRIs are left untouched.
+"""
+def normalize(q):
+    return _tokens.sub(lambda match: match.group(1) or " ", q).strip()
+
+"""
+The _cachepath function returns the path of the cached response of a query
+"""
+def _cachepath(q, endpoint, fmt):
+    key = hashlib.sha256("\n".join([endpoint, fmt, normalize(q)]).encode("utf-8")).hexdigest()
+    return os.path.join(_settings["directory"], key + "." + fmt)
+
+"""
+The _evict function removes the oldest cached responses until the cache fits within its size limit
+"""
+def _evict():
+    entries = []
+    total = 0
+    for entry in os.scandir(_settings["directory"]):
+        if entry.is_file() and not entry.name.startswith("."):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    entries.sort()
+    for mtime, size, path in entries:
+        if total <= _settings["max_bytes"]:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+"""
+The _store function writes a response to the cache. The file is replaced atomically so that
+concurrent readers never see a partially written response.
+"""
+def _store(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, temp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            f.write(content)
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+    _evict()
+
+"""
+The _open function sends a query to the endpoint and returns its HTTP response (a file-like
+object the raw response can be read from)
+"""
+def _open(q, endpoint, fmt):
+    wrapper = SPARQLWrapper(endpoint)
+    wrapper.setQuery(q)
+    wrapper.setReturnFormat(fmt)
+    return wrapper.query().response
+
+"""
+The _send function sends a query to the endpoint and returns the raw response
+"""
+def _send(q, endpoint, fmt):
+    start = time.perf_counter()
+    response = _open(q, endpoint, fmt)
+    try:
+        content = response.read()
+    finally:
+        response.close()
+    _count(bytes_received=len(content), query_seconds=time.perf_counter() - start)
+    return content
+
+"""
+The _fresh function returns whether the cached response at path can be used (it exists and
+is still fresh, or the cache is in replay mode). Raises CacheMiss in replay mode if it does not exist.
+"""
+def _fresh(path, q):
+    try:
+        age = time.time() - os.path.getmtime(path)
+    except OSError:
+        if _settings["replay"]:
+            raise CacheMiss("No cached response for query: " + normalize(q)[:200])
+        return False
+    return _settings["replay"] or age < _settings["ttl"]
+
+"""
+The fetch function returns the raw response (bytes) of a query in the JSON or CSV format,
+from the cache if possible, otherwise from the endpoint.
+"""
+def fetch(q, endpoint=ENDPOINT, fmt=JSON):
+    _count(queries=1)
+    if not _settings["enabled"]:
+        return _send(q, endpoint, fmt)
+
+    # Use the cached response if possible
+    path = _cachepath(q, endpoint, fmt)
+    if _fresh(path, q):
+        with open(path, "rb") as f:
+            content = f.read()
+        _count(cache_hits=1, bytes_cached=len(content))
+        return content
+
+    # Otherwise, send the query to the endpoint and cache its response
+    content = _send(q, endpoint, fmt)
+    _store(path, content)
+    return content
+
+"""
+The ask function runs a SPARQL ASK query and returns its JSON result (a dictionary
+whose "boolean" key holds the answer)
+"""
+def ask(q, endpoint=ENDPOINT):
+    return json.loads(fetch(q, endpoint, JSON))
+
+"""
+The bindings function runs a SPARQL SELECT query and returns its rows as a list of
+dictionaries that map each variable to a SPARQLWrapper Value (the same as SPARQLWrapper2)
+"""
+def bindings(q, endpoint=ENDPOINT):
+    results = json.loads(fetch(q, endpoint, JSON))
+    variables = results["head"]["vars"]
+    return [{var: Value(var, row[var]) for var in variables if var in row} for row in results["results"]["bindings"]]
+
+"""
+The dataframe function runs a SPARQL SELECT query and returns its results as a Pandas DataFrame
+"""
+def dataframe(q, endpoint=ENDPOINT):
+    import pandas
+    return pandas.read_csv(StringIO(fetch(q, endpoint, CSV).decode("utf-8")), sep=",")
+
+"""
+The _received function yields the lines of an HTTP response, counting the bytes received and
+the time spent waiting for them
+"""
+def _received(response):
+    while True:
+        start = time.perf_counter()
+        line = response.readline()
+        _count(bytes_received=len(line), query_seconds=time.perf_counter() - start)
+        if not line:
+            return
+        yield line
+
+"""
+The _lines function yields the lines of the raw response of a query, from the cache if
+possible, otherwise from the endpoint as they arrive. A response read from the endpoint is
+written to the cache as it is read, and only kept once it has been read completely.
+"""
+def _lines(q, endpoint, fmt):
+    _count(queries=1)
+    if _settings["enabled"]:
+        # Use the cached response if possible
+        path = _cachepath(q, endpoint, fmt)
+        if _fresh(path, q):
+            _count(cache_hits=1)
+            with open(path, "rb") as f:
+                for line in f:
+                    _count(bytes_cached=len(line))
+                    yield line.decode("utf-8")
+            return
+
+    start = time.perf_counter()
+    response = _open(q, endpoint, fmt)
+    _count(query_seconds=time.perf_counter() - start)
+
+    if not _settings["enabled"]:
+        try:
+            for line in _received(response):
+                yield line.decode("utf-8")
+        finally:
+            response.close()
+        return
+
+    # Copy the response to a temporary file while it is being read
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, temp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".")
+    complete = False
+    try:
+        with os.fdopen(handle, "wb") as f:
+            for line in _received(response):
+                f.write(line)
+                yield line.decode("utf-8")
+        os.replace(temp, path)
+        complete = True
+    finally:
+        response.close()
+        if not complete:
+            os.remove(temp)
+    _evict()
+
+"""
+The stream function runs a SPARQL SELECT query and yields its rows one at a time as
+dictionaries that map each variable to a SPARQLWrapper Value, parsing the CSV response
+while it is being downloaded. Variables without a value in a row are left out of it.
+"""
+def stream(q, endpoint=ENDPOINT):
+    reader = csv.reader(_lines(q, endpoint, CSV))
+    variables = next(reader, None)
+    if variables is None:
+        return
+    for row in reader:
+        yield {var: Value(var, {"type": "literal", "value": value}) for var, value in zip(variables, row) if value != ""}
+
+"""
+The batches function reads an iterable of rows on a background thread and yields the rows
+in lists of at most size rows. At most prefetch lists are read ahead, so memory stays bounded
+while the rows of one list are being processed and the next ones are being downloaded.
+"""
+def batches(rows, size=1000, prefetch=2):
+    lists = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    done = object()
+
+    # Puts an item in the queue, giving up if the consumer has stopped
+    def put(item):
+        while not stop.is_set():
+            try:
+                lists.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    # Reads the rows into lists on the background thread
+    def read():
+        try:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= size:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch and not put(batch):
+                return
+            put(done)
+        except BaseException as e:
+            put(e)
+        finally:
+            # Closes a generator of rows (e.g. stream) that was not read to the end
+            if hasattr(rows, "close"):
+                rows.close()
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = lists.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+"""
+The clear_cache function removes every cached response
+"""
+def clear_cache():
+    if not os.path.isdir(_settings["directory"]):
+        return
+    for entry in os.scandir(_settings["directory"]):
+        if entry.is_file():
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+"""
+The upload function replaces the named graph context of the endpoint's repository with the
+RDF in content (bytes in the Turtle format), using the RDF4J/GraphDB statements API. Responses
+of the cache are not affected.
+"""
+def upload(content, context, endpoint=ENDPOINT):
+    url = endpoint + "/statements?context=" + urllib.parse.quote("<" + context + ">")
+    request = urllib.request.Request(url, data=content, method="PUT", headers={"Content-Type": "text/turtle"})
+    with urllib.request.urlopen(request) as response:
+        response.read()
@@ -14,23 +14,174 @@ census data:
     
     2. wktintersect(wkt1, wkt2): a function that takes two WKT polygon geometries and
     calculates how much of Polygon1 overlaps with Polygon2
+
+    3. set_cache_limit(max_bytes): a function that sets the memory cap (in bytes) of
+    the parsed geometry cache shared by wkttopoly and wktintersect
+
+    4. clear_cache(): a function that empties the parsed geometry cache
+
+    5. overlap_matrix(tract_wkts, area_wkts): a function that calculates how much of
+    every tract polygon overlaps with every area polygon in one vectorized call
+
+    6. overlap_pairs(tract_wkts, area_wkts): a function that calculates how much of
+    each tract polygon overlaps with the area polygon it is paired with
+
+    7. overlap_weights(area_type, tracts, areas, tract_wkts, area_wkts): a function that
+    looks up tract/area overlaps (by tract and area IRI) in a persistent on-disk weight
+    table, calculating (and storing) only the pairs that are not in the table yet
+
+    8. load_weights(area_type) / save_weights(area_type, table): functions that read and
+    write the weight table of an administrative area type
+
+    9. zoom_tolerance(zoom): a function that returns the size of a map pixel (in degrees)
+    at a zoom level
+
+    10. simplify_features(geoj, tolerance, digits): a function that simplifies the polygons
+    of a GeoJSON feature collection and rounds their coordinates for rendering
+
+    11. topology(geoj, name, quantization, tolerance): a function that encodes a GeoJSON
+    feature collection as TopoJSON, storing every boundary shared by two areas only once
+
+    12. classify_pairs(tracts, areas): a function that classifies whether each tract polygon
+    lies within, outside of (disjoint) or partially in the area polygon it is paired with
+
+    13. counters(): a function that returns how many geometry operations of each kind were
+    run (and how long WKT parsing and overlap calculations took)
 """
 
-import geojson as geo
-import json
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import numpy
+import shapely
 
-from shapely.wkt import loads
+from collections import OrderedDict
+from shapely import STRtree, get_num_coordinates
 from shapely.geometry import mapping, shape
+from shapely.wkt import loads
+
+# Default memory cap (in bytes) for the parsed geometry cache
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+# Parsed geometries keyed by the hash of their WKT, ordered from least to most recently used
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_limit = DEFAULT_CACHE_BYTES
+_cache_lock = threading.Lock()
+
+# Running totals returned by counters
+_counters = {"wkt_parsed": 0, "wkt_cached": 0, "wkt_seconds": 0.0, "pairs_classified": 0, "intersections": 0,
+             "overlap_seconds": 0.0, "weights_stored": 0, "weights_computed": 0}
+_counters_lock = threading.Lock()
+
+# Codes returned by classify_pairs
+WITHIN = 0
+DISJOINT = 1
+PARTIAL = 2
+
+# Directory and format version of the persistent tract/area overlap weight tables
+WEIGHTS_DIR = os.path.join(os.path.expanduser("~"), ".censusvis", "weights")
+WEIGHTS_VERSION = 2
+_weights_lock = threading.Lock()
+
+# Weight tables read or written by overlap_weights, keyed by path, with the modification time and size of their file
+_weights_tables = {}
+
+"""
+The _wktkey function returns the cache key (a hash) for a WKT string
+"""
+def _wktkey(wkt):
+    return hashlib.blake2b(wkt.encode("utf-8"), digest_size=16).digest()
+
+"""
+The _geomsize function estimates how many bytes a Shapely geometry occupies
+(16 bytes per coordinate pair plus a fixed overhead for the object itself)
+"""
+def _geomsize(geometry):
+    return 16 * int(get_num_coordinates(geometry)) + 128
+
+"""
+The _evict function removes the least recently used geometries until the cache
+fits within its memory cap. Must be called while holding _cache_lock.
+"""
+def _evict():
+    global _cache_bytes
+    while _cache and _cache_bytes > _cache_limit:
+        key, (geometry, size) = _cache.popitem(last=False)
+        _cache_bytes -= size
+
+"""
+The _count function adds values to the running totals of counters
+"""
+def _count(**values):
+    with _counters_lock:
+        for name, value in values.items():
+            _counters[name] += value
+
+"""
+The counters function returns a copy of the running totals of the geometry operations of this process:
+    wkt_parsed, wkt_cached: the number of WKT geometries parsed and found in the parsed geometry cache
+    wkt_seconds: the time spent parsing WKT (summed over threads)
+    pairs_classified: the number of tract/area pairs classified with classify_pairs
+    intersections: the number of tract/area intersections calculated
+    overlap_seconds: the time spent calculating overlaps in overlap_matrix and wktintersect
+    weights_stored, weights_computed: the number of overlap weights found in and added to the weight tables
+"""
+def counters():
+    with _counters_lock:
+        return dict(_counters)
+
+"""
+The set_cache_limit function sets the memory cap (in bytes) of the parsed
+geometry cache. Setting the cap to 0 disables caching.
+"""
+def set_cache_limit(max_bytes):
+    global _cache_limit
+    with _cache_lock:
+        _cache_limit = max(0, int(max_bytes))
+        _evict()
+
+"""
+The clear_cache function removes every geometry from the parsed geometry cache
+"""
+def clear_cache():
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
 
 """
 The wkttopoly function takes a WKT polygon geometry and returns it as
-a Shapely polygon
+a Shapely polygon. Each WKT string is parsed only once; the parsed polygon
+is kept in a bounded LRU cache keyed by the hash of the WKT.
 """
 def wkttopoly(wkt):
-    geojson_string = geo.dumps(mapping(loads(wkt)))
-    geojson = json.loads(geojson_string)
-    polygon = shape(geojson)
-    
+    global _cache_bytes
+    key = _wktkey(wkt)
+
+    # Return the cached polygon (and mark it as most recently used) if it exists
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+            _count(wkt_cached=1)
+            return entry[0]
+
+    # Parse the WKT outside of the lock so that other threads are not blocked
+    start = time.perf_counter()
+    polygon = loads(wkt)
+    size = _geomsize(polygon)
+    _count(wkt_parsed=1, wkt_seconds=time.perf_counter() - start)
+
+    # Store the parsed polygon and evict old polygons if the cache is over its memory cap
+    with _cache_lock:
+        if key not in _cache and size <= _cache_limit:
+            _cache[key] = (polygon, size)
+            _cache_bytes += size
+            _evict()
+
     return polygon
 
 """
@@ -45,13 +196,476 @@ def wktintersect(wkt1, wkt2):
     # Converts wkt2 into a Shapely polygon called polygon2
     polygon2 = wkttopoly(wkt2)
     
+    # Polygon1 lies completely inside or outside of polygon2, so no intersection is needed
+    start = time.perf_counter()
+    code = classify_pairs(numpy.array([polygon1], dtype=object), numpy.array([polygon2], dtype=object))[0]
+    if code == WITHIN:
+        _count(overlap_seconds=time.perf_counter() - start)
+        return 1.0
+    if code == DISJOINT:
+        _count(overlap_seconds=time.perf_counter() - start)
+        return 0.0
+    
     # Uses Shapely's intersection function to create a Shapely polygon 
     # of the intersection of polygon1 and polygon2
     intersected = polygon1.intersection(polygon2)
     
     # Divides the area of the intersected polygon by the area of polygon1
     percent = intersected.area / polygon1.area
+    _count(intersections=1, overlap_seconds=time.perf_counter() - start)
     
     # Return the result
     return percent
 
+"""
+The classify_pairs function takes two equally long arrays of Shapely polygons and classifies
+how each tract (tracts[i]) lies in its area (areas[i]):
+    WITHIN: the tract is completely inside the area (its overlap is 1)
+    DISJOINT: the interiors do not intersect, they at most touch (its overlap is 0)
+    PARTIAL: the tract is partially inside the area (its overlap has to be calculated)
+The areas are prepared, so that testing many tracts against the same area is fast.
+Returns the result as a NumPy array of codes.
+"""
+def classify_pairs(tracts, areas):
+    shapely.prepare(areas)
+    _count(pairs_classified=len(tracts))
+    codes = numpy.full(len(tracts), PARTIAL, dtype=numpy.int8)
+    if len(tracts) == 0:
+        return codes
+
+    codes[shapely.covers(areas, tracts)] = WITHIN
+
+    # Only the remaining pairs are tested for being disjoint (or only touching)
+    rest = numpy.flatnonzero(codes == PARTIAL)
+    outside = ~shapely.intersects(areas[rest], tracts[rest]) | shapely.touches(areas[rest], tracts[rest])
+    codes[rest[outside]] = DISJOINT
+
+    # Return the result
+    return codes
+
+"""
+The overlap_matrix function takes a list of tract WKT polygon geometries and a list
+of area WKT polygon geometries and calculates how much of each tract overlaps with
+each area. Candidate pairs are found with an STRtree and classified with classify_pairs;
+only the intersections of the pairs that partially overlap are computed (with Shapely's
+vectorized array operations).
+Returns the result as a NumPy array with one row per tract and one column per area.
+"""
+def overlap_matrix(tract_wkts, area_wkts):
+    # Converts the WKT geometries into arrays of (cached) Shapely polygons
+    tracts = numpy.array([wkttopoly(wkt) for wkt in tract_wkts], dtype=object)
+    areas = numpy.array([wkttopoly(wkt) for wkt in area_wkts], dtype=object)
+
+    matrix = numpy.zeros((len(tracts), len(areas)))
+    if len(tracts) == 0 or len(areas) == 0:
+        return matrix
+
+    start = time.perf_counter()
+
+    # Uses a spatial index over the areas to find the tract/area pairs that intersect
+    tree = STRtree(areas)
+    tract_index, area_index = tree.query(tracts, predicate="intersects")
+
+    # Tracts within their area overlap it completely, and tracts that only touch it do not overlap it
+    codes = classify_pairs(tracts[tract_index], areas[area_index])
+    tract_area = shapely.area(tracts)[tract_index]
+    overlap = numpy.where((codes == WITHIN) & (tract_area > 0), 1.0, 0.0)
+
+    # Calculates the intersection area of every partially overlapping pair in one call and
+    # divides it by the area of the tract (tracts without an area get an overlap of 0)
+    partial = codes == PARTIAL
+    intersected = shapely.area(shapely.intersection(tracts[tract_index[partial]], areas[area_index[partial]]))
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        overlap[partial] = numpy.where(tract_area[partial] > 0, intersected / tract_area[partial], 0.0)
+    matrix[tract_index, area_index] = overlap
+    _count(intersections=int(partial.sum()), overlap_seconds=time.perf_counter() - start)
+
+    # Return the result
+    return matrix
+
+"""
+The overlap_pairs function takes two equally long lists of WKT polygon geometries and
+calculates how much of each tract (tract_wkts[i]) overlaps with its area (area_wkts[i]).
+Repeated geometries are only intersected once.
+Returns the result as a NumPy array with one value per pair.
+"""
+def overlap_pairs(tract_wkts, area_wkts):
+    # Assigns an index to every distinct tract and area geometry
+    tract_index = {}
+    area_index = {}
+    rows = numpy.array([tract_index.setdefault(wkt, len(tract_index)) for wkt in tract_wkts], dtype=numpy.intp)
+    cols = numpy.array([area_index.setdefault(wkt, len(area_index)) for wkt in area_wkts], dtype=numpy.intp)
+
+    # Calculates the overlap of every distinct tract with every distinct area, then picks out the pairs
+    matrix = overlap_matrix(list(tract_index), list(area_index))
+
+    # Return the result
+    return matrix[rows, cols]
+
+"""
+The _weightspath function returns the path of the weight table file of an
+administrative area type
+"""
+def _weightspath(area_type, directory=None):
+    return os.path.join(directory or WEIGHTS_DIR, area_type + ".npz")
+
+"""
+The _weightschecksum function returns a checksum of the contents of a weight table
+"""
+def _weightschecksum(tract, area, tract_hash, area_hash, weight):
+    digest = hashlib.blake2b(digest_size=16)
+    for column in (tract, area, tract_hash, area_hash):
+        digest.update("\x1f".join(column).encode("utf-8"))
+        digest.update(b"\x1e")
+    digest.update(numpy.ascontiguousarray(weight, dtype=numpy.float64).tobytes())
+    return digest.hexdigest()
+
+"""
+The load_weights function reads the weight table of an administrative area type.
+Returns a dictionary that maps (tract IRI, area IRI) to (tract WKT hash, area WKT hash, weight).
+An empty dictionary is returned if the table does not exist, was written by another
+version of this module or fails its checksum.
+"""
+def load_weights(area_type, directory=None):
+    path = _weightspath(area_type, directory)
+    if not os.path.exists(path):
+        return {}
+
+    try:
+        with numpy.load(path) as data:
+            if int(data["version"]) != WEIGHTS_VERSION:
+                return {}
+            tract = data["tract"].tolist()
+            area = data["area"].tolist()
+            tract_hash = data["tract_hash"].tolist()
+            area_hash = data["area_hash"].tolist()
+            weight = data["weight"]
+            checksum = str(data["checksum"])
+    except (OSError, KeyError, ValueError):
+        return {}
+
+    # Ignore tables that were corrupted or modified outside of this module
+    if checksum != _weightschecksum(tract, area, tract_hash, area_hash, weight):
+        return {}
+
+    return dict(zip(zip(tract, area), zip(tract_hash, area_hash, weight.tolist())))
+
+"""
+The save_weights function writes the weight table of an administrative area type
+(a dictionary in the format returned by load_weights) as a compressed NumPy .npz file.
+The file is replaced atomically so that readers never see a partially written table.
+"""
+def save_weights(area_type, table, directory=None):
+    path = _weightspath(area_type, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Splits the table into columns
+    keys = list(table)
+    tract = [key[0] for key in keys]
+    area = [key[1] for key in keys]
+    tract_hash = [table[key][0] for key in keys]
+    area_hash = [table[key][1] for key in keys]
+    weight = numpy.array([table[key][2] for key in keys], dtype=numpy.float64)
+    checksum = _weightschecksum(tract, area, tract_hash, area_hash, weight)
+
+    # Writes the columns to a temporary file, then moves it over the old table
+    handle, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".npz")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            numpy.savez_compressed(f, version=WEIGHTS_VERSION, tract=numpy.array(tract, dtype=str),
+                                   area=numpy.array(area, dtype=str), tract_hash=numpy.array(tract_hash, dtype=str),
+                                   area_hash=numpy.array(area_hash, dtype=str), weight=weight, checksum=checksum)
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+
+"""
+The _weightsstamp function returns the modification time and size of a weight table file,
+or None if it does not exist
+"""
+def _weightsstamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+"""
+The overlap_weights function takes an administrative area type and, for each tract/area
+pair, the IRI of the tract, the IRI of the area and their WKT polygon geometries.
+It calculates how much of each tract overlaps with its area, the same as overlap_pairs,
+but looks the pairs up in the persistent weight table of the area type first. Only pairs
+that are missing from the table (or whose geometry has changed since they were stored)
+are calculated, after which the table is updated on disk. The table is kept in memory and
+only read again when its file has been changed by another process.
+Returns the result as a NumPy array with one value per pair.
+"""
+def overlap_weights(area_type, tracts, areas, tract_wkts, area_wkts, directory=None):
+    # Hashes the geometries so that stored weights of changed geometries are not reused
+    tract_hashes = [_wktkey(wkt).hex() for wkt in tract_wkts]
+    area_hashes = [_wktkey(wkt).hex() for wkt in area_wkts]
+
+    path = _weightspath(area_type, directory)
+    with _weights_lock:
+        stamp = _weightsstamp(path)
+        cached = _weights_tables.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, load_weights(area_type, directory))
+            _weights_tables[path] = cached
+        table = cached[1]
+
+        # Looks up the weight of every pair that is already in the table
+        weights = numpy.zeros(len(tracts))
+        missing = []
+        for i, key in enumerate(zip(tracts, areas)):
+            entry = table.get(key)
+            if entry is not None and entry[0] == tract_hashes[i] and entry[1] == area_hashes[i]:
+                weights[i] = entry[2]
+            else:
+                missing.append(i)
+
+        # Calculates the missing weights in one batch and stores them in the table
+        if missing:
+            computed = overlap_pairs([tract_wkts[i] for i in missing], [area_wkts[i] for i in missing])
+            for i, weight in zip(missing, computed.tolist()):
+                weights[i] = weight
+                table[(tracts[i], areas[i])] = (tract_hashes[i], area_hashes[i], weight)
+            save_weights(area_type, table, directory)
+            _weights_tables[path] = (_weightsstamp(path), table)
+        _count(weights_stored=len(tracts) - len(missing), weights_computed=len(missing))
+
+    # Return the result
+    return weights
+
+"""
+The zoom_tolerance function returns the width of one map pixel in degrees of longitude at
+a (Leaflet/web mercator) zoom level. Detail smaller than this is not visible at that zoom.
+"""
+def zoom_tolerance(zoom):
+    return 360.0 / (256 * 2 ** zoom)
+
+"""
+The _roundcoords function rounds nested coordinate sequences to digits decimals
+"""
+def _roundcoords(coords, digits):
+    if isinstance(coords[0], (int, float)):
+        return [round(c, digits) for c in coords]
+    return [_roundcoords(c, digits) for c in coords]
+
+"""
+The simplify_features function takes a GeoJSON feature collection and returns a new one
+whose polygons are simplified with the given tolerance (in degrees, preserving topology so
+that no polygon becomes invalid) and whose coordinates are rounded to digits decimals.
+The properties of the features are kept as they are.
+"""
+def simplify_features(geoj, tolerance, digits):
+    features = geoj["features"]
+    if not features:
+        return {"type": "FeatureCollection", "features": []}
+
+    # Simplifies all the polygons in one vectorized call
+    geometries = numpy.array([shape(feature["geometry"]) for feature in features], dtype=object)
+    geometries = shapely.simplify(geometries, tolerance, preserve_topology=True)
+
+    # Converts the polygons back to GeoJSON with rounded coordinates
+    simplified = []
+    for feature, geometry in zip(features, geometries):
+        geometry = mapping(geometry)
+        if geometry["type"] == "GeometryCollection":
+            geometry = {"type": "GeometryCollection", "geometries": [{"type": part["type"], "coordinates": _roundcoords(part["coordinates"], digits)} for part in geometry["geometries"]]}
+        else:
+            geometry = {"type": geometry["type"], "coordinates": _roundcoords(geometry["coordinates"], digits)}
+        simplified.append({"type": "Feature", "geometry": geometry, "properties": feature["properties"]})
+
+    return {"type": "FeatureCollection", "features": simplified}
+
+"""
+The _positions function yields every [x, y] position of a GeoJSON geometry
+"""
+def _positions(geometry):
+    if geometry is None:
+        return
+    if geometry["type"] == "GeometryCollection":
+        for part in geometry["geometries"]:
+            yield from _positions(part)
+        return
+
+    def walk(coords):
+        if isinstance(coords[0], (int, float)):
+            yield coords
+        else:
+            for c in coords:
+                yield from walk(c)
+
+    if geometry["coordinates"]:
+        yield from walk(geometry["coordinates"])
+
+"""
+The topology function takes a GeoJSON feature collection and returns it encoded as a
+TopoJSON topology with a single GeometryCollection object called name (to be referenced
+as "objects." + name). Coordinates are quantized to a quantization x quantization grid.
+Polygon rings are cut into arcs wherever they meet a different ring, so that a boundary
+shared by two areas is stored once and referenced by both. If tolerance (in degrees) is
+given, the arcs are simplified, which keeps shared boundaries identical on both sides.
+"""
+def topology(geoj, name="areas", quantization=100000, tolerance=None):
+    features = geoj["features"]
+    positions = [p for feature in features for p in _positions(feature["geometry"])]
+    if not positions:
+        return {"type": "Topology", "objects": {name: {"type": "GeometryCollection", "geometries": [
+            {"type": None, "properties": feature["properties"]} for feature in features]}}, "arcs": []}
+
+    # Uses the same scale on both axes so that the tolerance is the same in every direction
+    xy = numpy.array(positions, dtype=float)[:, :2]
+    x0, y0 = xy.min(axis=0)
+    x1, y1 = xy.max(axis=0)
+    scale = max(x1 - x0, y1 - y0) / (quantization - 1) or 1.0
+
+    def quantize(position):
+        return (int(round((position[0] - x0) / scale)), int(round((position[1] - y0) / scale)))
+
+    # Quantizes a ring, dropping repeated points. Returns None if the ring collapses.
+    def quantizering(coords):
+        ring = []
+        for position in coords:
+            point = quantize(position)
+            if not ring or ring[-1] != point:
+                ring.append(point)
+        if ring[0] != ring[-1]:
+            ring.append(ring[0])
+        return ring if len(ring) >= 4 else None
+
+    # Converts every geometry to lists of quantized rings (the first ring of a polygon is its shell)
+    def polygons(geometry):
+        if geometry["type"] == "Polygon":
+            rings = [geometry["coordinates"]] if geometry["coordinates"] else []
+        else:
+            rings = geometry["coordinates"]
+        result = []
+        for polygon in rings:
+            shell = quantizering(polygon[0])
+            if shell is None:
+                continue
+            result.append([shell] + [ring for ring in map(quantizering, polygon[1:]) if ring is not None])
+        return result
+
+    def convert(geometry):
+        if geometry is None:
+            return None
+        if geometry["type"] == "GeometryCollection":
+            return {"type": "GeometryCollection", "geometries": [convert(part) for part in geometry["geometries"]]}
+        if geometry["type"] in ("Polygon", "MultiPolygon"):
+            return {"type": "MultiPolygon", "polygons": polygons(geometry)}
+        if geometry["type"] == "Point":
+            return {"type": "Point", "coordinates": list(quantize(geometry["coordinates"]))}
+        if geometry["type"] == "MultiPoint":
+            return {"type": "MultiPoint", "coordinates": [list(quantize(p)) for p in geometry["coordinates"]]}
+        raise ValueError("Unsupported geometry type for TopoJSON: " + geometry["type"])
+
+    converted = [convert(feature["geometry"]) for feature in features]
+
+    def rings(geometry):
+        if geometry is None:
+            return
+        if geometry["type"] == "GeometryCollection":
+            for part in geometry["geometries"]:
+                yield from rings(part)
+        elif geometry["type"] == "MultiPolygon":
+            for polygon in geometry["polygons"]:
+                yield from polygon
+
+    # A point is a junction if rings pass through it with different neighbouring points
+    neighbours = {}
+    junctions = set()
+    for geometry in converted:
+        for ring in rings(geometry):
+            n = len(ring) - 1
+            for i in range(n):
+                point = ring[i]
+                pair = frozenset((ring[i - 1 if i else n - 1], ring[i + 1]))
+                seen = neighbours.setdefault(point, pair)
+                if seen != pair:
+                    junctions.add(point)
+
+    # Cuts the rings into arcs at the junctions, storing each arc once (in either direction)
+    arcs = []
+    index = {}
+
+    def arc(points):
+        key = tuple(points)
+        if key in index:
+            return index[key]
+        reverse = key[::-1]
+        if reverse in index:
+            return ~index[reverse]
+        index[key] = len(arcs)
+        arcs.append(key)
+        return index[key]
+
+    def cut(ring):
+        points = ring[:-1]
+        cuts = [i for i, point in enumerate(points) if point in junctions]
+        if not cuts:
+            # A ring without junctions is one closed arc, rotated to start at its lowest point
+            start = points.index(min(points))
+            points = points[start:] + points[:start]
+            return [arc(points + [points[0]])]
+        start = cuts[0]
+        points = points[start:] + points[:start] + [points[start]]
+        refs = []
+        begin = 0
+        for i in range(1, len(points)):
+            if points[i] in junctions or i == len(points) - 1:
+                refs.append(arc(points[begin:i + 1]))
+                begin = i
+        return refs
+
+    def encode(geometry, properties):
+        if geometry is None:
+            result = {"type": None}
+        elif geometry["type"] == "GeometryCollection":
+            result = {"type": "GeometryCollection", "geometries": [encode(part, None) for part in geometry["geometries"]]}
+        elif geometry["type"] == "MultiPolygon":
+            polygons = [[cut(ring) for ring in polygon] for polygon in geometry["polygons"]]
+            if not polygons:
+                result = {"type": None}
+            elif len(polygons) == 1:
+                result = {"type": "Polygon", "arcs": polygons[0]}
+            else:
+                result = {"type": "MultiPolygon", "arcs": polygons}
+        else:
+            result = dict(geometry)
+        if properties is not None:
+            result["properties"] = properties
+        return result
+
+    geometries = [encode(geometry, feature["properties"]) for geometry, feature in zip(converted, features)]
+
+    # Simplifies the arcs (their end points, where they meet other arcs, are always kept)
+    if tolerance:
+        lines = numpy.array([shapely.LineString(a) for a in arcs], dtype=object)
+        lines = shapely.simplify(lines, tolerance / scale, preserve_topology=True)
+        simplified = []
+        for original, line in zip(arcs, lines):
+            points = [tuple(int(c) for c in point) for point in shapely.get_coordinates(line)]
+            # Keeps closed arcs that would collapse as they are
+            simplified.append(points if original[0] != original[-1] or len(points) >= 4 else original)
+        arcs = simplified
+
+    # Delta-encodes the arcs
+    encoded = []
+    for points in arcs:
+        x, y = points[0]
+        deltas = [[x, y]]
+        for px, py in points[1:]:
+            deltas.append([px - x, py - y])
+            x, y = px, py
+        encoded.append(deltas)
+
+    return {
+        "type": "Topology",
+        "transform": {"scale": [scale, scale], "translate": [float(x0), float(y0)]},
+        "objects": {name: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": encoded,
+    }
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+CensusTrace.py
+
+Author: Anderson Wong
+
+Date: October 17, 2026
+
+Description: This is a Python module that records how long each stage of a CensusVis
+pipeline takes:
+
+    1. Trace(name): a class that records the stages of one run. Each stage has its start,
+    wall time and thread, the values the pipeline gives it (e.g. the number of rows) and how
+    much the counters of CensusQuery (queries, bytes transferred) and CensusTools (geometry
+    operations) grew during it.
+
+    2. stage(trace, name): a function that records a stage in a trace, or does nothing if
+    trace is None
+
+    3. counters(): a function that returns the counters of CensusQuery and CensusTools
+
+    4. iterate(trace, name, items): a function that records the time spent waiting for the
+    items of an iterator (e.g. streamed query results) as one stage, without the time spent
+    processing them
+
+A trace can be saved as JSON lines (one stage per line) and in the Chrome trace event format
+(which can be opened in chrome://tracing or https://ui.perfetto.dev), and summarized as text.
+The counters are shared by every thread of the process, so stages that overlap with other
+work (e.g. a search while a map is generated) also count that work.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+import CensusQuery
+import CensusTools
+
+"""
+The counters function returns the running totals of CensusQuery.counters and CensusTools.counters
+"""
+def counters():
+    values = CensusQuery.counters()
+    values.update(CensusTools.counters())
+    return values
+
+"""
+A Trace records the stages of one run of a pipeline. Stages are recorded with the stage method
+(a context manager) or, for stages timed outside of Python (e.g. showing a map), with add.
+"""
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.origin = time.perf_counter()
+        self.created = time.time()
+        self.spans = []
+        self.lock = threading.Lock()
+
+    """
+    The stage method records the code run inside of it as a stage called name. It yields the
+    dictionary of values of the stage, which the pipeline can add to (e.g. rows or bytes).
+    The stage is recorded even if it raises an exception (with its error).
+    """
+    @contextlib.contextmanager
+    def stage(self, name, **values):
+        before = counters()
+        start = time.perf_counter()
+        try:
+            yield values
+        except BaseException as e:
+            values["error"] = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            after = counters()
+            for counter, value in after.items():
+                if value != before[counter]:
+                    values[counter] = round(value - before[counter], 6) if isinstance(value, float) else value - before[counter]
+            self.add(name, start, seconds, **values)
+
+    """
+    The add method records a stage called name that started at start (a time.perf_counter value)
+    and took seconds, with the given values
+    """
+    def add(self, name, start, seconds, **values):
+        span = {"stage": name, "start": round(start - self.origin, 6), "seconds": round(seconds, 6),
+                "thread": threading.get_ident(), "values": values}
+        with self.lock:
+            self.spans.append(span)
+
+    """
+    The stages method returns the total wall time of each stage name, in the order the stages started
+    """
+    def stages(self):
+        totals = {}
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        for span in spans:
+            totals[span["stage"]] = totals.get(span["stage"], 0.0) + span["seconds"]
+        return totals
+
+    """
+    The jsonl method returns the stages as JSON lines (one JSON object for each stage)
+    """
+    def jsonl(self):
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        return "".join(json.dumps(dict({"trace": self.name, "time": self.created}, **span)) + "\n" for span in spans)
+
+    """
+    The chrome method returns the stages in the Chrome trace event format (a dictionary that
+    can be saved as JSON), as complete events timed in microseconds since the epoch (so that
+    the traces of several runs or processes can be merged)
+    """
+    def chrome(self):
+        with self.lock:
+            spans = list(self.spans)
+        events = [{"name": span["stage"], "cat": self.name, "ph": "X", "ts": round((self.created + span["start"]) * 1e6),
+                   "dur": round(span["seconds"] * 1e6), "pid": os.getpid(), "tid": span["thread"], "args": span["values"]}
+                  for span in spans]
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"trace": self.name}}
+
+    """
+    The save method saves the stages as path.jsonl (appending to it) and path.trace.json
+    """
+    def save(self, path):
+        with open(path + ".jsonl", "a", encoding="utf-8") as f:
+            f.write(self.jsonl())
+        with open(path + ".trace.json", "w", encoding="utf-8") as f:
+            json.dump(self.chrome(), f)
+
+    """
+    The summary method returns one line of text for each stage with its wall time and the most
+    telling of its values (rows, queries, bytes transferred and geometry operations)
+    """
+    def summary(self):
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        lines = []
+        for span in spans:
+            values = span["values"]
+            details = []
+            for key, label in (("rows", "rows"), ("features", "areas"), ("queries", "queries"), ("cache_hits", "cached")):
+                if key in values:
+                    details.append(str(values[key]) + " " + label)
+            transferred = values.get("bytes_received", 0) + values.get("bytes_cached", 0)
+            if transferred:
+                details.append(str(round(transferred / 1024)) + " KB transferred")
+            if "bytes" in values:
+                details.append(str(round(values["bytes"] / 1024)) + " KB")
+            if "wkt_parsed" in values:
+                details.append(str(values["wkt_parsed"]) + " WKT parsed")
+            if "intersections" in values:
+                details.append(str(values["intersections"]) + " intersections")
+            if "error" in values:
+                details.append(values["error"])
+            lines.append(span["stage"] + ": " + str(round(span["seconds"], 3)) + " s" + (" (" + ", ".join(details) + ")" if details else ""))
+        return "\n".join(lines)
+
+"""
+The iterate function yields the items of items and records the time spent getting them (the
+sum of the waits for every item, not the time the caller spends on them) and how much the
+counters grew during those waits as one stage called name. The stage starts with the first
+wait. Its values are values (a dictionary the caller can add to while it iterates) and the
+number of items. Does nothing but yield the items if trace is None.
+"""
+def iterate(trace, name, items, values=None):
+    if trace is None:
+        yield from items
+        return
+    if values is None:
+        values = {}
+
+    iterator = iter(items)
+    start = None
+    seconds = 0.0
+    grown = {}
+    count = 0
+    try:
+        while True:
+            before = counters()
+            started = time.perf_counter()
+            if start is None:
+                start = started
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                seconds += time.perf_counter() - started
+                for counter, value in counters().items():
+                    if value != before[counter]:
+                        grown[counter] = grown.get(counter, 0) + value - before[counter]
+            count += 1
+            yield item
+    finally:
+        values["items"] = count
+        for counter, value in grown.items():
+            values[counter] = round(value, 6) if isinstance(value, float) else value
+        trace.add(name, start if start is not None else time.perf_counter(), seconds, **values)
+
+"""
+The stage function returns trace.stage(name, **values), or a context manager that does nothing
+(but still yields a dictionary of values) if trace is None
+"""
+def stage(trace, name, **values):
+    if trace is None:
+        return contextlib.nullcontext(values)
+    return trace.stage(name, **values)
@@ -10,34 +10,174 @@ Description: This is a Python program that generates interactive data visualizat
 census linked data from a SPARQL endpoint. The generated visualization is saved as an HTML 
 file in your current working directory that can be opened using any web browser. 
 """
-import folium
-import shapely.wkt
-import pandas
-import geojson
-import sparql_dataframe
-import CensusTools
+import CensusEngine
+import json
 import sys
-import os
+import threading
+import time
 
-from PyQt5.QtWidgets import QApplication, QWidget, QTabWidget, QLineEdit, QPushButton, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QComboBox
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication, QWidget, QTabWidget, QLineEdit, QPushButton, QVBoxLayout, QLabel, QTableView, QComboBox, QCheckBox
+from PyQt5.QtCore import Qt, QObject, QRunnable, QAbstractTableModel, QModelIndex, QThreadPool, QTimer, QBuffer, QIODevice, QUrl, pyqtSignal
+from PyQt5.QtWebEngineCore import QWebEngineUrlRequestJob, QWebEngineUrlScheme, QWebEngineUrlSchemeHandler
 from PyQt5 import QtWebEngineWidgets
-from SPARQLWrapper import SPARQLWrapper, SPARQLWrapper2, JSON
 
-# Set the SPARQL endpoint to the Canadian Census GraphDB
-sparql = SPARQLWrapper("http://ec2-3-97-59-180.ca-central-1.compute.amazonaws.com:7200/repositories/CACensus")
-sparql.setReturnFormat(JSON)
-sparql2 = SPARQLWrapper2("http://ec2-3-97-59-180.ca-central-1.compute.amazonaws.com:7200/repositories/CACensus")
-endpoint = "http://ec2-3-97-59-180.ca-central-1.compute.amazonaws.com:7200/repositories/CACensus"
+# URL scheme the generated maps are shown from (it has to be registered before the QApplication is created)
+MAP_SCHEME = b"censusvis"
+_mapscheme = QWebEngineUrlScheme(MAP_SCHEME)
+_mapscheme.setSyntax(QWebEngineUrlScheme.Syntax.Path)
+_mapscheme.setFlags(QWebEngineUrlScheme.SecureScheme)
+QWebEngineUrlScheme.registerScheme(_mapscheme)
 
-# Initialize a GeoJSON variable
-geoj = {"type": "FeatureCollection", "features": []}
+# How long (in milliseconds) typing has to pause before the search is run
+SEARCH_DELAY = 150
+
+# Number of search results the results table adds at a time as it is scrolled
+FETCH_ROWS = 200
+
+# Separates the display names of several indicators (descriptions often contain commas)
+NAME_SEPARATOR = "|"
+
+# Signals a Worker uses to report back to the Qt main thread
+class WorkerSignals(QObject):
+    progress = pyqtSignal(str)
+    finished = pyqtSignal(object)
+    error = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+"""
+A Worker runs a pipeline function on the QThreadPool so that the window does not freeze.
+The function is called with the worker's arguments and keyword arguments plus progress and
+cancelled keyword arguments, and its return value is delivered through the finished signal. Cancelling a
+worker stops its pipeline at the next checkpoint.
+"""
+class Worker(QRunnable):
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self.stop = threading.Event()
+        
+    def cancel(self):
+        self.stop.set()
+        
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs, progress=self.signals.progress.emit, cancelled=self.stop.is_set)
+        except CensusEngine.Cancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.error.emit(str(e))
+        else:
+            # A pipeline that was cancelled after its last checkpoint still does not deliver its result
+            if self.stop.is_set():
+                self.signals.cancelled.emit()
+            else:
+                self.signals.finished.emit(result)
+
+"""
+A MapSchemeHandler serves the HTML of generated maps to the web engine from memory, so that
+a map is shown without being read back from disk (and without the size limit of setHtml).
+Only the latest map is kept. It is shown by loading the URL returned by show.
+"""
+class MapSchemeHandler(QWebEngineUrlSchemeHandler):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.count = 0
+        self.pages = {}
+        
+    def show(self, html):
+        self.count += 1
+        self.pages = {str(self.count): html.encode("utf-8")}
+        return QUrl(MAP_SCHEME.decode() + ":" + str(self.count))
+        
+    def requestStarted(self, job):
+        page = self.pages.get(job.requestUrl().path())
+        if page is None:
+            job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+            return
+        buffer = QBuffer(job)
+        buffer.setData(page)
+        buffer.open(QIODevice.ReadOnly)
+        job.reply(b"text/html", buffer)
+
+"""
+A SearchResultsModel serves a list of [indicator URI, description] search results to a table
+view. Only the first FETCH_ROWS results are shown at first; the view fetches more (see
+canFetchMore and fetchMore) as it is scrolled to the end, so that large result sets are
+shown at once.
+"""
+class SearchResultsModel(QAbstractTableModel):
+    HEADERS = ["Indicator URI", "Description"]
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.results = []
+        self.loaded = 0
+        
+    def set_results(self, results):
+        self.beginResetModel()
+        self.results = results
+        self.loaded = min(FETCH_ROWS, len(results))
+        self.endResetModel()
+        
+    def result(self, row):
+        return self.results[row]
+        
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+        
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+        
+    def data(self, index, role=Qt.DisplayRole):
+        if index.isValid() and role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return self.results[index.row()][index.column()]
+        return None
+        
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+        
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.loaded < len(self.results)
+        
+    def fetchMore(self, parent):
+        if parent.isValid():
+            return
+        count = min(FETCH_ROWS, len(self.results) - self.loaded)
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
 
 # Create a QtWindow
 class Window(QWidget):
     def __init__(self):
         super().__init__()
         
+        # Thread pool that runs the visualization pipelines, a thread pool with one thread that runs the
+        # searches (so that searches waiting for the catalog to load never hold the visualization's threads),
+        # and the workers currently running them
+        self.threadpool = QThreadPool()
+        self.searchpool = QThreadPool()
+        self.searchpool.setMaxThreadCount(1)
+        self.searchworker = None
+        self.generateworker = None
+        self.areaworker = None
+        
+        # Search text and results that are shown (None until a search has finished)
+        self.lastsearch = None
+        
+        # Trace of the map that is being loaded and when its loading started, and the trace whose
+        # stages are not all done yet with its file name and the stages it is waiting for
+        self.shownload = None
+        self.pendingtrace = None
+        
+        # Area type and area names of the map that is shown (None until a map has been generated)
+        self.shownmap = None
+        
         # Set window title to "CensusVis"
         self.setWindowTitle("CensusVis")
         
@@ -75,30 +215,14 @@ class Window(QWidget):
         widget.setAlignment(Qt.AlignmentFlag.AlignLeft)
         layout.addWidget(widget)
         
-        # Create combo box for administrative area input
-        q = """
-        PREFIX iso50872: <http://ontology.eil.utoronto.ca/5087/2/City/>
-        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-        SELECT DISTINCT ?area
-        FROM <http://www.ontotext.com/explicit>
-        WHERE{
-        ?area rdfs:subClassOf iso50872:CityAdministrativeArea;
-        } 
-        """
-    
-        # Converts SPARQL query results into a Pandas DataFrame
-        df = sparql_dataframe.get(endpoint, q)
-        
+        # Create combo box for administrative area input (filled once the area types are loaded, see load_area_types)
         self.combobox1 = QComboBox()
-        # Adds the data in the DataFrame to the geoj GeoJSON variable
-        for index, row in df.iterrows():
-            if row["area"] != "http://ontology.eil.utoronto.ca/Toronto/Toronto#BusinessImprovementArea":
-                self.combobox1.addItem(row["area"].replace("http://ontology.eil.utoronto.ca/Toronto/Toronto#", ""))
+        self.combobox1.setEnabled(False)
         self.combobox1.setFixedWidth(500)
         layout.addWidget(self.combobox1)
         
         # Print prompt for indicator URI
-        widget = QLabel("URI of the indicator to be visualized (e.g. http://ontology.eil.utoronto.ca/tove/cacensus#LowIncomeMeasureAfterTax2016).")
+        widget = QLabel("URI of the indicator to be visualized (e.g. http://ontology.eil.utoronto.ca/tove/cacensus#LowIncomeMeasureAfterTax2016).\nSeparate several URIs with commas to compare them on one map.")
         font = widget.font()
         font.setPointSize(10)
         widget.setFont(font)
@@ -112,7 +236,7 @@ class Window(QWidget):
         layout.addWidget(self.charainput, alignment=Qt.AlignmentFlag.AlignLeft)
         
         # Print prompt for display name
-        widget = QLabel("Display name of the indicator (e.g. Number of low-income individuals)")
+        widget = QLabel("Display name of the indicator (e.g. Number of low-income individuals), one for each URI separated by " + NAME_SEPARATOR)
         font = widget.font()
         font.setPointSize(10)
         widget.setFont(font)
@@ -139,10 +263,28 @@ class Window(QWidget):
         self.fileinput.setFixedWidth(500)
         layout.addWidget(self.fileinput, alignment=Qt.AlignmentFlag.AlignLeft)   
         
+        # Create check box for saving the map as TopoJSON (smaller files for large maps)
+        self.topojsoncheck = QCheckBox("Save the map as TopoJSON (smaller file, no highlighting on hover)")
+        layout.addWidget(self.topojsoncheck, alignment=Qt.AlignmentFlag.AlignLeft)
+        
+        # Create check box for recolouring the shown map instead of generating a new one when only the indicator changes
+        self.restylecheck = QCheckBox("Only recolour the shown map if the area type is unchanged (faster, not saved)")
+        layout.addWidget(self.restylecheck, alignment=Qt.AlignmentFlag.AlignLeft)
+        
+        # Create check box for showing how long each stage of the visualization took (the trace is also saved)
+        self.timingcheck = QCheckBox("Show how long each stage took (also saved as <file name>_trace.jsonl and <file name>_trace.trace.json)")
+        layout.addWidget(self.timingcheck, alignment=Qt.AlignmentFlag.AlignLeft)
+        
         # Create button to generate the visualization
-        button = QPushButton("Generate Visualization")
-        button.clicked.connect(self.generate)
-        layout.addWidget(button)
+        self.generatebutton = QPushButton("Generate Visualization")
+        self.generatebutton.clicked.connect(self.generate)
+        layout.addWidget(self.generatebutton)
+        
+        # Create button to cancel a visualization that is being generated
+        self.cancelbutton = QPushButton("Cancel")
+        self.cancelbutton.clicked.connect(self.cancel_generate)
+        self.cancelbutton.setEnabled(False)
+        layout.addWidget(self.cancelbutton)
         
         # Create a QLabel for the finished message
         self.output = QLabel()
@@ -153,8 +295,20 @@ class Window(QWidget):
         self.output.setAlignment(Qt.AlignmentFlag.AlignLeft)
         layout.addWidget(self.output)       
         
-        # Create a web engine widget to show the HTML visualization
+        # Create a QLabel for the stage timings
+        self.timings = QLabel()
+        font = self.timings.font()
+        font.setPointSize(9)
+        self.timings.setFont(font)
+        self.timings.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.timings.setAlignment(Qt.AlignmentFlag.AlignLeft)
+        layout.addWidget(self.timings)
+        
+        # Create a web engine widget to show the HTML visualization (served from memory by the map scheme handler)
         self.webEngineView = QtWebEngineWidgets.QWebEngineView()
+        self.maphandler = MapSchemeHandler(self)
+        self.webEngineView.page().profile().installUrlSchemeHandler(MAP_SCHEME, self.maphandler)
+        self.webEngineView.loadFinished.connect(self.map_loaded)
         layout.addWidget(self.webEngineView)
         
         # Set layout for search tab as vertical box layout
@@ -188,9 +342,15 @@ class Window(QWidget):
         widget.setAlignment(Qt.AlignmentFlag.AlignLeft)
         layout2.addWidget(widget)
         
-        # Create text box for search input
+        # Create text box for search input (the search is run as it is typed, once typing pauses)
         self.searchinput = QLineEdit()
         self.searchinput.setFixedWidth(500)
+        self.searchtimer = QTimer(self)
+        self.searchtimer.setSingleShot(True)
+        self.searchtimer.setInterval(SEARCH_DELAY)
+        self.searchtimer.timeout.connect(self.search)
+        self.searchinput.textChanged.connect(lambda text: self.searchtimer.start())
+        self.searchinput.returnPressed.connect(self.search)
         layout2.addWidget(self.searchinput, alignment=Qt.AlignmentFlag.AlignLeft)
         
         # Create search button
@@ -207,715 +367,310 @@ class Window(QWidget):
         self.output2.setAlignment(Qt.AlignmentFlag.AlignLeft)
         layout2.addWidget(self.output2)
         
-        # Create a table widget to output search results
-        self.tableWidget = QTableWidget()
-        self.tableWidget.setColumnCount(2)
-        self.tableWidget.setColumnWidth(0, 250)
-        self.tableWidget.setColumnWidth(1, 600)
-        self.tableWidget.setHorizontalHeaderLabels(['Indicator URI', 'Description'])
-        self.tableWidget.cellDoubleClicked.connect(self.cell_select)
-        layout2.addWidget(self.tableWidget)
+        # Create a table view to output search results (rows are only sized once they are visible)
+        self.resultsmodel = SearchResultsModel(self)
+        self.tableView = QTableView()
+        self.tableView.setModel(self.resultsmodel)
+        self.tableView.setColumnWidth(0, 250)
+        self.tableView.setColumnWidth(1, 600)
+        self.tableView.setWordWrap(True)
+        self.tableView.doubleClicked.connect(self.cell_select)
+        self.tableView.verticalScrollBar().valueChanged.connect(self.resize_visible_rows)
+        self.resultsmodel.modelReset.connect(self.resize_visible_rows)
+        self.resultsmodel.rowsInserted.connect(self.resize_visible_rows)
+        layout2.addWidget(self.tableView)
+        
+        # Load the types of administrative areas without freezing the window
+        self.load_area_types()
+    
+    # Function that queries the types of administrative areas on the thread pool
+    def load_area_types(self):
+        # Nothing to do if they are already being loaded
+        if self.areaworker is not None:
+            return
+        worker = Worker(CensusEngine.area_types)
+        worker.signals.progress.connect(self.output.setText)
+        worker.signals.finished.connect(self.area_types_loaded)
+        worker.signals.error.connect(self.area_types_failed)
+        self.areaworker = worker
+        self.threadpool.start(worker)
+        
+    # Function that fills the administrative area combo box with the loaded types
+    def area_types_loaded(self, areas):
+        self.areaworker = None
+        self.combobox1.clear()
+        self.combobox1.addItems(areas)
+        self.combobox1.setEnabled(True)
+        self.output.setText("")
+        
+    # Function that outputs the error of loading the types of administrative areas
+    def area_types_failed(self, message):
+        self.areaworker = None
+        self.output.setText("Sorry, the types of administrative areas could not be loaded: " + message + "\nPress Generate to try again.")
     
     # Function that auto fills text fields in the Visualization Generator tab using a selected search result
     def cell_select(self):
         # Get the row number of the selected cell
-        row = self.tableWidget.currentItem().row()
+        row = self.tableView.currentIndex().row()
+        if row < 0:
+            return
         
-        # Get the indicator URI
-        cell1 = self.tableWidget.item(row, 0).text()
-        # Get the indicator description
-        cell2 = self.tableWidget.item(row, 1).text()
+        # Get the indicator URI and description
+        cell1, cell2 = self.resultsmodel.result(row)
         
         # Enter the indicator URI into the indicator URI input box
         self.charainput.setText(cell1)
-        # Enter the indicator description into the display name input box
-        self.displayinput.setText(cell2)
+        # Enter the indicator description into the display name input box (without the separator of display names)
+        self.displayinput.setText(cell2.replace(NAME_SEPARATOR, "/"))
         # Set the default file name as "visualization"
         self.fileinput.setText("Visualization")
         
         # Switch to the Visualization Generator tab 
         self.tabs.setCurrentIndex(1)
-        
-    
+
     # Indicator search function    
     def search(self):
+        self.searchtimer.stop()
         search = self.searchinput.text()
         
-        # SPARQL query that returns the indicators that match the user's search terms
-        q = """
-        PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#> 
-        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-        
-        SELECT DISTINCT ?class ?comment
+        # Cancel the previous search if it is still running, or remove it from the queue if it has not started
+        if self.searchworker is not None:
+            self.searchworker.cancel()
+            self.searchpool.tryTake(self.searchworker)
+            self.searchworker = None
         
-        WHERE{
-            ?class rdfs:subClassOf iso21972:Indicator;
-            rdfs:comment ?comment
-            FILTER CONTAINS(lcase(?comment), lcase(\"""" + search + """\")) 
-        }
-        """
-        df = sparql_dataframe.get(endpoint, q)
+        # Nothing to do if the results of this search are already shown
+        if self.lastsearch is not None and self.lastsearch[0] == search:
+            return
         
-        # Convert results from SPARQL query into a list
-        results = []
-        for index, row in df.iterrows():
-            results.append([row["class"], row["comment"]])
+        # A search that extends the shown one only has to search the shown results
+        within = None
+        if self.lastsearch is not None and CensusEngine.narrows(self.lastsearch[0], search):
+            within = self.lastsearch[1]
+        
+        # Run the search on the search thread pool (it waits there until the previous search has stopped)
+        worker = Worker(CensusEngine.run_search, search, within=within)
+        worker.signals.progress.connect(self.output2.setText)
+        worker.signals.finished.connect(lambda results: self.search_finished(worker, search, results))
+        worker.signals.error.connect(lambda message: self.search_failed(worker, message))
+        self.searchworker = worker
+        self.searchpool.start(worker)
+        
+    # Function that outputs the results of a finished search
+    def search_finished(self, worker, search, results):
+        # Ignore results of a search that has been replaced by a newer one
+        if worker is not self.searchworker:
+            return
+        self.searchworker = None
+        self.lastsearch = (search, results)
         
         # Output search results as a table
-        self.tableWidget.setRowCount(len(results))
-        row = 0
-        for item in results:
-            self.tableWidget.setItem(row, 0, QTableWidgetItem(item[0]))
-            self.tableWidget.setItem(row, 1, QTableWidgetItem(item[1]))
-            row += 1
-        
-        self.tableWidget.resizeRowsToContents()
+        self.tableView.scrollToTop()
+        self.resultsmodel.set_results(results)
+        
         # Print search result message
         self.output2.setText("Here are the search results for \"" + search + "\".\nDouble clicking on a search result will auto-fill the Visualization Generation tab using the selected indicator.")
         
+    # Function that fits the height of the rows of the results table that are visible to their contents
+    def resize_visible_rows(self, *args):
+        first = self.tableView.rowAt(0)
+        if first < 0:
+            return
+        last = self.tableView.rowAt(self.tableView.viewport().height() - 1)
+        if last < 0:
+            last = self.resultsmodel.rowCount() - 1
+        for row in range(first, last + 1):
+            self.tableView.resizeRowToContents(row)
+        
+    # Function that outputs the error of a failed search
+    def search_failed(self, worker, message):
+        if worker is not self.searchworker:
+            return
+        self.searchworker = None
+        self.output2.setText("Sorry, the search failed: " + message)
+        
     # Visualization generator function 
     def generate(self):
+        # The types of administrative areas have to be loaded first (e.g. the endpoint was down at startup)
+        if not self.combobox1.isEnabled():
+            self.load_area_types()
+            return
+        
         area = self.combobox1.currentText()
         characteristic = self.charainput.text()
         indicator = self.displayinput.text()
         filename = self.fileinput.text()
-        
-        # Check if indicator URI input is valid
-        sparql.setQuery("PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#>  ASK {<" + characteristic + "> rdfs:subClassOf iso21972:Indicator}")
-        valid = sparql.query().convert()
-        
-        if valid["boolean"] == False:
-            self.output.setText("Sorry, your Indicator URI input is invalid.")
+        topojson = self.topojsoncheck.isChecked()
+        
+        # If several indicators are given, generate a map that compares them
+        characteristics = [c.strip() for c in characteristic.split(",") if c.strip()]
+        if len(characteristics) > 1:
+            indicators = [name.strip() for name in indicator.split(NAME_SEPARATOR)]
+            if len(indicators) != len(characteristics) or not all(indicators):
+                self.output.setText("Sorry, " + str(len(characteristics)) + " indicator URIs were given but " + str(len([name for name in indicators if name]))
+                                    + " display names. Please give one display name for each URI, separated by " + NAME_SEPARATOR + ".")
+                return
+            self.generate_multi(area, characteristics, indicators, filename)
             return
         
-        person = characteristic.replace("http://ontology.eil.utoronto.ca/tove/cacensus#", "http://ontology.eil.utoronto.ca/tove/cacensus#" + "Person")
-        male = characteristic.replace("http://ontology.eil.utoronto.ca/tove/cacensus#", "http://ontology.eil.utoronto.ca/tove/cacensus#" + "Male")
-        female = characteristic.replace("http://ontology.eil.utoronto.ca/tove/cacensus#", "http://ontology.eil.utoronto.ca/tove/cacensus#" + "Female")
-        # SPARQL query to check whether the characteristic has values for male/female population
-        sparql.setQuery("PREFIX uoft: <http://ontology.eil.utoronto.ca/tove/cacensus#> PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#> PREFIX foaf: <http://xmlns.com/foaf/0.1/> ASK {<" + male + "> rdfs:subClassOf foaf:Person}")
-        results = sparql.query().convert()
-        
-        # SPARQL query to check if the administrative area of the indicator is the same as the administrative area for the visualization
-        sparql.setQuery( """
-        PREFIX uoft: <http://ontology.eil.utoronto.ca/tove/cacensus#>
-        PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
-        PREFIX iso50872: <http://ontology.eil.utoronto.ca/5087/2/City/>
-     
-        ASK{
-        ?area2 a iso50872:CityAdministrativeArea.
-        ?limat a <""" + characteristic + """>;
-        ?p ?area2.
-        ?area2 a toronto:""" + area + """
-        }
-        """)
-        results2 = sparql.query().convert()
-        
-        # SPARQL query to check if the administrative area of the indicator is a properPartOf the administrative area for the visualization
-        sparql.setQuery( """
-        PREFIX uoft: <http://ontology.eil.utoronto.ca/tove/cacensus#>
-        PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
-        PREFIX iso50872: <http://ontology.eil.utoronto.ca/5087/2/City/>
-        PREFIX iso5087m: <http://ontology.eil.utoronto.ca/5087/1/Mereology/>
-        
-        ASK{
-        ?area a toronto:""" + area + """.
-        ?area2 a iso50872:CityAdministrativeArea.
-        ?limat a <""" + characteristic + """>;
-        ?p ?area2.
-        ?area2 iso5087m:properPartOf ?area
-        }
-        """)
-        results3 = sparql.query().convert()
-        
-        print(results, results2, results3)
-        
-        # If the selected administrative area is the same as the indicator's administrative area, use one of the following 2 SPARQL queries.
-        if results2["boolean"]:    
-            if results["boolean"]:
-                """
-                If values for male/female population exist, query for:
-                    ?areaname: Name of the administrative area
-                    ?areawkt: The polygon coordinates for the administrative area in WKT format
-                    ?sumvalue: The value of the characteristic for the total population
-                    ?sumvaluemale: The value of the characteristic for the male population
-                    ?sumvaluefemale: The value of the characteristic for the female population
-                """
-                                            
-                q = """
-                PREFIX uoft: <http://ontology.eil.utoronto.ca/tove/cacensus#>
-                PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
-                PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#> 
-                PREFIX iso50871: <http://ontology.eil.utoronto.ca/5087/1/SpatialLoc/>
-                PREFIX iso5087m: <http://ontology.eil.utoronto.ca/5087/1/Mereology/>
-                PREFIX geo: <http://www.opengis.net/ont/geosparql#>
-                PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-                SELECT DISTINCT ?areaname
-                ?sumvalue
-                ?areawkt
-                ?sumvaluemale
-                ?sumvaluefemale
-                
-                WHERE{
-                ?area a toronto:""" + area + """;
-                rdfs:comment ?areaname;
-                iso50871:hasLocation ?location. 
-               
-                ?location geo:asWKT ?areawkt.
-                
-                ?limat a <""" + characteristic + """>; 
-                uoft:hasLocation ?area; 
-                iso21972:cardinality_of ?population; 
-                iso21972:value ?measure.
-                
-                ?measure iso21972:numerical_value ?sumvalue. 
-            
-                ?population a ?populationclass. 
-                ?populationclass iso21972:defined_by <""" + person + """>.
-                
-                ?limatmale a <""" + characteristic + """>; 
-                uoft:hasLocation ?area; 
-                iso21972:cardinality_of ?populationmale; 
-                iso21972:value ?measuremale.
-                    
-                ?measuremale iso21972:numerical_value ?sumvaluemale. 
-                
-                ?populationmale a ?populationclassmale. 
-                ?populationclassmale iso21972:defined_by <""" + male + """>.
-                
-                ?limatfemale a <""" + characteristic + """>; 
-                uoft:hasLocation ?area; 
-                iso21972:cardinality_of ?populationfemale; 
-                iso21972:value ?measurefemale.
-                    
-                ?measurefemale iso21972:numerical_value ?sumvaluefemale. 
-            
-                ?populationfemale a ?populationclassfemale. 
-                ?populationclassfemale iso21972:defined_by <""" + female + """>.
-                } 
-                """
-            
-                # Converts SPARQL query results into a Pandas DataFrame
-                df = sparql_dataframe.get(endpoint, q)
-                
-                # Adds the data in the DataFrame to the geoj GeoJSON variable
-                for index, row in df.iterrows():
-                    geoj["features"].append(geojson.Feature(geometry=shapely.wkt.loads(row['areawkt']), properties={"areaname": row["areaname"], "sumvalue": row["sumvalue"], "sumvaluemale": row["sumvaluemale"], "sumvaluefemale": row["sumvaluefemale"]}))
-            
-            else:
-                """
-                Else, query for:
-                    ?areaname: Name of the administrative area
-                    ?areawkt: The polygon coordinates for the administrative area in WKT format
-                    ?sumvalue: The value of the characteristic for the total population
-                """
-                
-                q = """
-                PREFIX uoft: <http://ontology.eil.utoronto.ca/tove/cacensus#>
-                PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
-                PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#> 
-                PREFIX iso50871: <http://ontology.eil.utoronto.ca/5087/1/SpatialLoc/>
-                PREFIX iso5087m: <http://ontology.eil.utoronto.ca/5087/1/Mereology/>
-                PREFIX geo: <http://www.opengis.net/ont/geosparql#>
-                PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-                SELECT DISTINCT ?areaname
-                ?areawkt
-                ?sumvalue
-                FROM <http://www.ontotext.com/explicit>
-                WHERE{
-                ?area a toronto:""" + area + """;
-                rdfs:comment ?areaname;
-                iso50871:hasLocation ?location. 
-               
-                ?location geo:asWKT ?areawkt.
-                
-                ?limat a <""" + characteristic + """>; 
-                ?p ?area; 
-                iso21972:value ?measure.
-                
-                ?measure iso21972:numerical_value ?sumvalue. 
-                } 
-                """
-            
-                # Converts SPARQL query results into a Pandas DataFrame
-                df = sparql_dataframe.get(endpoint, q)
-                
-                # Adds the data in the DataFrame to the geoj GeoJSON variable
-                for index, row in df.iterrows():
-                    geoj["features"].append(geojson.Feature(geometry=shapely.wkt.loads(row['areawkt']), properties={"areaname": row["areaname"], "sumvalue": row["sumvalue"]}))
-                
-        # Else, use one of the following 2 SPARQL queries.      
+        # If only the indicator changed, recolour the shown map instead of generating a new one
+        if self.restylecheck.isChecked() and self.shownmap is not None and self.shownmap[0] == area:
+            report = {}
+            worker = Worker(CensusEngine.run_restyle, area, characteristic, indicator, self.shownmap[1], report)
+            worker.signals.progress.connect(self.output.setText)
+            worker.signals.finished.connect(lambda update: self.restyle_finished(area, characteristic, indicator, filename, topojson, update, report))
+            worker.signals.error.connect(self.generate_failed)
+            worker.signals.cancelled.connect(self.generate_cancelled)
+            self.start_generate(worker)
         else:
-            if results["boolean"]:
-                """
-                If values for male/female population exist, query for:
-                    ?areaname: Name of the administrative area
-                    ?areawkt: The polygon coordinates for the administrative area in WKT format
-                    ?censuswkt: The polygon coordinates for a census tract located in the administrative area in WKT format
-                    ?sumvalue: The value of the characteristic for the total population in the census tract
-                    ?sumvaluemale: The value of the characteristic for the male population in the census tract
-                    ?sumvaluefemale: The value of the characteristic for the female population in the census tract
-                """
-                
-                sparql2.setQuery("""
-                PREFIX uoft: <http://ontology.eil.utoronto.ca/tove/cacensus#>
-                PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
-                PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#> 
-                PREFIX iso50871: <http://ontology.eil.utoronto.ca/5087/1/SpatialLoc/>
-                PREFIX iso5087m: <http://ontology.eil.utoronto.ca/5087/1/Mereology/>
-                PREFIX geo: <http://www.opengis.net/ont/geosparql#>
-                PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-                SELECT DISTINCT ?areaname
-                ?areaname2
-                ?areawkt
-                ?censuswkt
-                ?value
-                ?valuemale
-                ?valuefemale
-            
-                WHERE{
-                ?area a toronto:""" + area + """;
-                iso50871:hasLocation ?location;
-                rdfs:comment ?areaname;
-                toronto:hasCensusTract ?censustract.
-                   
-                ?location geo:asWKT ?areawkt.
-                
-                ?censustract rdfs:comment ?areaname2;
-                iso50871:hasLocation ?censuslocation.
-                
-                ?censuslocation geo:asWKT ?censuswkt.
-                    
-                ?limat a <""" + characteristic + """>; 
-                uoft:hasLocation ?censustract; 
-                iso21972:cardinality_of ?population; 
-                iso21972:value ?measure.
-                    
-                ?measure iso21972:numerical_value ?value. 
-            
-                ?population a ?populationclass. 
-                ?populationclass iso21972:defined_by <""" + person + """>.
-                
-                ?limatmale a <""" + characteristic + """>; 
-                uoft:hasLocation ?censustract; 
-                iso21972:cardinality_of ?populationmale; 
-                iso21972:value ?measuremale.
-                    
-                ?measuremale iso21972:numerical_value ?valuemale. 
-            
-                ?populationmale a ?populationclassmale. 
-                ?populationclassmale iso21972:defined_by <""" + male + """>.
-                
-                ?limatfemale a <""" + characteristic + """>; 
-                uoft:hasLocation ?censustract; 
-                iso21972:cardinality_of ?populationfemale; 
-                iso21972:value ?measurefemale.
-                    
-                ?measurefemale iso21972:numerical_value ?valuefemale. 
-            
-                ?populationfemale a ?populationclassfemale. 
-                ?populationclassfemale iso21972:defined_by <""" + female + """>.
-                } 
-                """)
-                
-                # Initializes a dictionary variable for storing the results of the query
-                dic = {}
-                
-                # Initializes a dictionary variable that will be converted to a Pandas DataFrame
-                dfdic = {"areaname": [], "wkt": [], "sumvalue": [], "sumvaluemale": [], "sumvaluefemale": []}
-
-                # Iterates through each SPARQL query result
-                for result in sparql2.query().bindings:
-                    """
-                    Creates a key:value pair in the dic dictionary to store data for the administrative area 
-                    if it does not already exist.  Each administrative area has its own dictionary containing:
-                        areaname: The name of the administrative area
-                        wkt: The polygon coordinates for the administrative area in WKT format
-                        sumvalue: The value of the characteristic for the total population in the administrative area
-                        sumvaluemale: The value of the characteristic for the male population in the administrative area
-                        sumvaluefemale: The value of the characteristic for the female population in the administrative area
-                    """
-                    if not(str(result["areaname"].value) in dic):
-                        dic[str(result["areaname"].value)] = {"areaname": str(result["areaname"].value) + "<br> <br>", "wkt": str(result["areawkt"].value), "sumvalue": 0, "sumvaluemale": 0, "sumvaluefemale": 0, "multiplier": ""}
-                    
-                    # Get the total, male, female values of the characteristic from the query result
-                    try: 
-                        value = float(result["value"].value)
-                        valuemale = float(result["valuemale"].value)
-                        valuefemale = float(result["valuefemale"].value)
-                    # If there's an error (due to no data), set values to 0
-                    except:
-                        value = 0
-                        valuemale = 0
-                        valuefemale = 0
-                    
-                    # Uses the wktintersect function from the CensusTools module to calculate how much
-                    # of the census tract overlaps with the administrative area
-                    multiplier = CensusTools.wktintersect(str(result["censuswkt"].value), str(result["areawkt"].value))
-                    
-                    # Multiply the result by the total, male, female values
-                    mvalue = multiplier * value
-                    mvaluemale = multiplier * valuemale
-                    mvaluefemale = multiplier * valuefemale
-                    
-                    # Add the calculated total, male, female values to the administrative 
-                    # area's sumvalue, sumvaluemale, sumvaluefemale, respectively
-                    dic[str(result["areaname"].value)]["sumvalue"] += mvalue
-                    dic[str(result["areaname"].value)]["sumvaluemale"] += mvaluemale
-                    dic[str(result["areaname"].value)]["sumvaluefemale"] += mvaluefemale
-                    dic[str(result["areaname"].value)]["multiplier"] +="<br>" + result["areaname2"].value + ": " + str(round(multiplier*100, 1)) 
-                # Iterates through the dic dictionary and converts the data into GeoJSON and Pandas DataFrame format
-                for key in dic:
-                    # Round sumvalue, sumvaluemale, sumvaluefemale to the nearest whole number
-                    sumvalue = round(dic[key]["sumvalue"])
-                    sumvaluemale = round(dic[key]["sumvaluemale"])
-                    sumvaluefemale = round(dic[key]["sumvaluefemale"])
-                    
-                    # Converts data to GeoJson
-                    geoj["features"].append(geojson.Feature(geometry=shapely.wkt.loads(dic[key]['wkt']), properties={"areaname": dic[key]["areaname"], "sumvalue": sumvalue, "sumvaluemale": sumvaluemale, "sumvaluefemale": sumvaluefemale, "multiplier": dic[key]["multiplier"]}))
-                    
-                    # Converts data to a dictionary that is compatible with Pandas DataFrame
-                    dfdic["areaname"].append(dic[key]["areaname"])
-                    dfdic["wkt"].append(dic[key]["wkt"])
-                    dfdic["sumvalue"].append(sumvalue)
-                    dfdic["sumvaluemale"].append(sumvaluemale)
-                    dfdic["sumvaluefemale"].append(sumvaluefemale)
-                
-                # Converts the dfdic dictionary into a Pandas DataFrame
-                df = pandas.DataFrame(dfdic)
-            
-            else:
-                if results3["boolean"]:
-                    """
-                    Else, query for:
-                        ?areaname: Name of the administrative area
-                        ?areawkt: The polygon coordinates for the administrative area in WKT format
-                        ?censuswkt: The polygon coordinates for a census tract located in the administrative area in WKT format
-                        ?sumvalue: The value of the characteristic for the total population in the census tract
-                    """
-                    
-                    sparql2.setQuery("""
-                    PREFIX uoft: <http://ontology.eil.utoronto.ca/tove/cacensus#>
-                    PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
-                    PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#> 
-                    PREFIX iso50871: <http://ontology.eil.utoronto.ca/5087/1/SpatialLoc/>
-                    PREFIX iso5087m: <http://ontology.eil.utoronto.ca/5087/1/Mereology/>
-                    PREFIX geo: <http://www.opengis.net/ont/geosparql#>
-                    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-                    SELECT DISTINCT ?areaname
-                    ?areaname2
-                    ?areawkt
-                    ?censuswkt
-                    ?value
-                    
-                    
-                    WHERE{
-                    ?area a toronto:""" + area + """;
-                    iso50871:hasLocation ?location;
-                    rdfs:comment ?areaname;
-                    iso5087m:hasProperPart ?censustract.
-                       
-                    ?location geo:asWKT ?areawkt.
-                    
-                    ?censustract rdfs:comment ?areaname2;
-                    iso50871:hasLocation ?censuslocation.
-                    
-                    ?censuslocation geo:asWKT ?censuswkt.
-                        
-                    ?limat a <""" + characteristic + """>; 
-                    ?p ?censustract; 
-                    iso21972:value ?measure.
-                        
-                    ?measure iso21972:numerical_value ?value. 
-                    } 
-                    """)
-
-                    
-                else:
-                    """
-                    Else, query for:
-                        ?areaname: Name of the administrative area
-                        ?areawkt: The polygon coordinates for the administrative area in WKT format
-                        ?censuswkt: The polygon coordinates for a census tract located in the administrative area in WKT format
-                        ?sumvalue: The value of the characteristic for the total population in the census tract
-                    """
-                    
-                    sparql2.setQuery("""
-                    PREFIX uoft: <http://ontology.eil.utoronto.ca/tove/cacensus#>
-                    PREFIX toronto: <http://ontology.eil.utoronto.ca/Toronto/Toronto#>
-                    PREFIX iso21972: <http://ontology.eil.utoronto.ca/ISO21972/iso21972#> 
-                    PREFIX iso50871: <http://ontology.eil.utoronto.ca/5087/1/SpatialLoc/>
-                    PREFIX iso5087m: <http://ontology.eil.utoronto.ca/5087/1/Mereology/>
-                    PREFIX geo: <http://www.opengis.net/ont/geosparql#>
-                    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-                    SELECT DISTINCT ?areaname
-                    ?areaname2
-                    ?areawkt
-                    ?censuswkt
-                    ?value
-                    
-                    
-                    WHERE{
-                    ?area a toronto:""" + area + """;
-                    iso50871:hasLocation ?location;
-                    rdfs:comment ?areaname;
-                    iso5087m:properPartOf ?censustract.
-                       
-                    ?location geo:asWKT ?areawkt.
-                    
-                    ?censustract rdfs:comment ?areaname2;
-                    iso50871:hasLocation ?censuslocation.
-                    
-                    ?censuslocation geo:asWKT ?censuswkt.
-                        
-                    ?limat a <""" + characteristic + """>; 
-                    ?p ?censustract; 
-                    iso21972:value ?measure.
-                        
-                    ?measure iso21972:numerical_value ?value. 
-                    } 
-                    """)
-                    
-                # Initializes a dictionary variable for storing the results of the query
-                dic = {}
-                
-                # Initializes a dictionary variable that will be converted to a Pandas DataFrame
-                dfdic = {"areaname": [], "wkt": [], "sumvalue": []}
-            
-                # Iterates through each SPARQL query result
-                for result in sparql2.query().bindings:
-                    """
-                    Creates a key:value pair in the dic dictionary to store data for the administrative area 
-                    if it does not already exist.  Each administrative area has its own dictionary containing:
-                        areaname: The name of the administrative area
-                        wkt: The polygon coordinates for the administrative area in WKT format
-                        sumvalue: The value of the characteristic for the total population in the administrative area
-                    """
-                    if not(str(result["areaname"].value) in dic):
-                        dic[str(result["areaname"].value)] = {"areaname": str(result["areaname"].value) + "<br> <br>", "wkt": str(result["areawkt"].value), "sumvalue": 0, "multiplier": ""}
-                        
-                    # Get the value of the characteristic from the query result
-                    try: 
-                        value = float(result["value"].value)
-                    # If there's an error (due to no data), set value to 0
-                    except:
-                        value = 0
-                    
-                    # Uses the wktintersect function from the CensusTools module to calculate how much
-                    # of the census tract overlaps with the administrative area
-                    multiplier = CensusTools.wktintersect(str(result["censuswkt"].value), str(result["areawkt"].value))
-                    
-                    # Multiply the result by the values
-                    mvalue = multiplier * value
-                    
-                    # Add the calculated value to the administrative area's sumvalue
-                    dic[str(result["areaname"].value)]["sumvalue"] += mvalue
-                    dic[str(result["areaname"].value)]["multiplier"] += "<br>" + result["areaname2"].value + ": " + str(round(multiplier*100, 1)) 
-                
-                # Iterates through the dic dictionary and converts the data into GeoJSON and Pandas DataFrame format
-                for key in dic:
-                    # Round sumvalue to the nearest whole number
-                    sumvalue = round(dic[key]["sumvalue"])
-                    
-                    # Converts data to GeoJson
-                    geoj["features"].append(geojson.Feature(geometry=shapely.wkt.loads(dic[key]['wkt']), properties={"areaname": dic[key]["areaname"], "sumvalue": sumvalue, "multiplier": dic[key]["multiplier"]}))
-                    
-                    # Converts data to a dictionary that is compatible with Pandas DataFrame
-                    dfdic["areaname"].append(dic[key]["areaname"])
-                    dfdic["wkt"].append(dic[key]["wkt"])
-                    dfdic["sumvalue"].append(sumvalue)
-                
-                # Converts the dfdic dictionary into a Pandas DataFrame
-                df = pandas.DataFrame(dfdic)
-                
-                    
-            
-
-        # Create a folium map centered at the location specified by the coordinates
-        m = folium.Map(location=[43.6581,-79.3845], zoom_start=12)
-
-        # Create a colour scale based on the indicator values from the data in the Pandas DataFrame
-        custom_scale = (df["sumvalue"].quantile((0,0.2,0.4,0.6,0.8,1))).tolist()
-
-        # Create a choropleth layer using the data in the GeoJSON and Pandas DataFrame and add it to the folium map
-        choro = folium.Choropleth(
-            # Use geo data from the geoj GeoJSON variable for the choropleth layer
-            geo_data=geoj,
-            # Use the display name entered by the user as the name of the choropleth layer
-            name=indicator,
-            # Use data from the df Pandas DataFrame for the choropleth layer
-            data=df,
-            # Create polygons of the administrative areas and color them according to their sumvalue
-            columns=["areaname", "sumvalue"],
-            key_on="feature.properties.areaname",
-            # Use the custom_scale color scale for coloring the visualization
-            threshold_scale=custom_scale, 
-            # Color the visualization using yellow, orange, and red
-            fill_color='YlOrRd',
-            # Use the color white if the value of the indicator is 0
-            nan_fill_color="White",
-            # Set the opacity of the polygons
-            fill_opacity=0.7,
-            # Set the opacity of the polygon outlines
-            line_opacity=0.2,
-            # Use the display name entered by the user for the color legend in the top right of the visualization
-            legend_name=indicator,
-            # Highlight if polygon is selected
-            highlight=True,
-            # Set polygon outline color to black
-            line_color='black'
-            ).add_to(m)
-
-        # If values for male/female population exist, create a GeoJSON object containing popup boxes 
-        # that show the administrative area name and the total, male, female values for the indicator
-        if results["boolean"]:
-            if results2["boolean"]:
-                folium.features.GeoJson(
-                    # Use data from the geoj GeoJSON variable for the popup boxes
-                    data=geoj,
-                    # Use the display name entered by the user as the name for the GeoJSON object
-                    name=indicator,
-                    # Set smooth factor to 2. More means better performance and smoother look, and less means more accurate representation.
-                    smooth_factor=2,
-                    # Set the color, fill color to transparent and stroke width (weight) to 0.5 
-                    style_function=lambda x: {'color':'transparent','fillColor':'transparent','weight':0.5},
-                    # Create popup boxes that show the administrative area name and the total, male, female values for the indicator
-                    tooltip=folium.features.GeoJsonTooltip(
-                        # Use areaname, sumvalue, sumvaluemale, sumvaluefemale from geoj as values for the popup box
-                        fields=['areaname',
-                                'sumvalue',
-                                'sumvaluemale',
-                                'sumvaluefemale',
-                                ],
-                        # Use the administrative area type and the display name entered by the user as labels for the above values
-                        aliases=[area,
-                                 indicator + " (Total)",
-                                 indicator + " (Male)",
-                                 indicator + " (Female)",
-                                 ], 
-                        # Use JavaScript’s .toLocaleString() to format values (i.e. comma separators, float truncation)
-                        localize=True,
-                        # Use to set whether the popup box follows the mouse cursor
-                        sticky=False,
-                        # Use to toggle whether to show the labels and values
-                        labels=True,
-                        # Set max width of the popup box
-                        max_width=300)
-                    ).add_to(choro)
-            else:
-                folium.features.GeoJson(
-                    # Use data from the geoj GeoJSON variable for the popup boxes
-                    data=geoj,
-                    # Use the display name entered by the user as the name for the GeoJSON object
-                    name=indicator,
-                    # Set smooth factor to 2. More means better performance and smoother look, and less means more accurate representation.
-                    smooth_factor=2,
-                    # Set the color, fill color to transparent and stroke width (weight) to 0.5 
-                    style_function=lambda x: {'color':'transparent','fillColor':'transparent','weight':0.5},
-                    # Create popup boxes that show the administrative area name and the total, male, female values for the indicator
-                    tooltip=folium.features.GeoJsonTooltip(
-                        # Use areaname, sumvalue, sumvaluemale, sumvaluefemale from geoj as values for the popup box
-                        fields=['areaname',
-                                'sumvalue',
-                                'sumvaluemale',
-                                'sumvaluefemale',
-                                'multiplier'
-                                ],
-                        # Use the administrative area type and the display name entered by the user as labels for the above values
-                        aliases=[area + "<br> <br>",
-                                 indicator + " (Total)",
-                                 indicator + " (Male)",
-                                 indicator + " (Female)",
-                                 "Administrative areas used for calculation"
-                                 ], 
-                        # Use JavaScript’s .toLocaleString() to format values (i.e. comma separators, float truncation)
-                        localize=True,
-                        # Use to set whether the popup box follows the mouse cursor
-                        sticky=False,
-                        # Use to toggle whether to show the labels and values
-                        labels=True,
-                        # Set max width of the popup box
-                        max_width=300)
-                    ).add_to(choro)
-        # Else, create a GeoJSON object containing popup boxes showing the administrative area name and the value for the indicator
-        else:
-            if results2["boolean"]:
-                folium.features.GeoJson(
-                    # Use data from the geoj GeoJSON variable for the popup boxes
-                    data=geoj,
-                    # Use the display name entered by the user as the name for the GeoJSON object
-                    name= indicator,
-                    # Set smooth factor to 2. More means better performance and smoother look, and less means more accurate representation.
-                    smooth_factor=2,
-                    # Set the color, fill color to transparent and stroke width (weight) to 0.5 
-                    style_function=lambda x: {'color':'transparent','fillColor':'transparent','weight':0.5},
-                    # Create popup boxes that show the administrative area name and the value for the indicator
-                    tooltip=folium.features.GeoJsonTooltip(
-                        # Use areaname, sumvalue from geoj as values for the popup box
-                        fields=['areaname',
-                                'sumvalue',
-                                ],
-                        # Use the administrative area type and the display name entered by the user as labels for the above values
-                        aliases=[area,
-                                 indicator
-                                 ], 
-                        # Use JavaScript’s .toLocaleString() to format values (i.e. comma separators, float truncation)
-                        localize=True,
-                        # Use to set whether the popup box follows the mouse cursor
-                        sticky=False,
-                        # Use to toggle whether to show the labels and values
-                        labels=True,
-                        # Set max width of the popup box
-                        max_width=300)
-                    ).add_to(choro)
-            else:
-                folium.features.GeoJson(
-                    # Use data from the geoj GeoJSON variable for the popup boxes
-                    data=geoj,
-                    # Use the display name entered by the user as the name for the GeoJSON object
-                    name= indicator,
-                    # Set smooth factor to 2. More means better performance and smoother look, and less means more accurate representation.
-                    smooth_factor=2,
-                    # Set the color, fill color to transparent and stroke width (weight) to 0.5 
-                    style_function=lambda x: {'color':'transparent','fillColor':'transparent','weight':0.5},
-                    # Create popup boxes that show the administrative area name and the value for the indicator
-                    tooltip=folium.features.GeoJsonTooltip(
-                        # Use areaname, sumvalue from geoj as values for the popup box
-                        fields=['areaname',
-                                'sumvalue',
-                                'multiplier'
-                                ],
-                        # Use the administrative area type and the display name entered by the user as labels for the above values
-                        aliases=[area + "<br> <br>",
-                                 indicator,
-                                 "Administrative areas used for calculation"
-                                 ], 
-                        # Use JavaScript’s .toLocaleString() to format values (i.e. comma separators, float truncation)
-                        localize=True,
-                        # Use to set whether the popup box follows the mouse cursor
-                        sticky=False,
-                        # Use to toggle whether to show the labels and values
-                        labels=True,
-                        # Set max width of the popup box
-                        max_width=300)
-                    ).add_to(choro)
-                
-
-        # Add a LayerControl to the map which adds a toggle for showing/hiding the choropleth layer
-        folium.LayerControl().add_to(m)
-
-        # Save the visualization map using the file name specified by the user
-        m.save(filename + ".html")
+            self.generate_map(area, characteristic, indicator, filename, topojson)
+        
+    # Function that generates a new visualization
+    def generate_map(self, area, characteristic, indicator, filename, topojson):
+        # Run the visualization pipeline on the thread pool (it fills report with the memory usage of the run).
+        # The map is saved separately once it is shown.
+        report = {}
+        worker = Worker(CensusEngine.run_generate, area, characteristic, indicator, filename, report, topojson=topojson, save=False)
+        worker.signals.progress.connect(self.output.setText)
+        worker.signals.finished.connect(lambda html: self.generate_finished(area, filename, html, report))
+        worker.signals.error.connect(self.generate_failed)
+        worker.signals.cancelled.connect(self.generate_cancelled)
+        self.start_generate(worker)
+        
+    # Function that generates a visualization comparing several indicators (one layer for each)
+    def generate_multi(self, area, characteristics, indicators, filename):
+        report = {}
+        worker = Worker(CensusEngine.run_generate_multi, area, characteristics, indicators, filename, report, save=False)
+        worker.signals.progress.connect(self.output.setText)
+        worker.signals.finished.connect(lambda html: self.generate_finished(None, filename, html, report))
+        worker.signals.error.connect(self.generate_failed)
+        worker.signals.cancelled.connect(self.generate_cancelled)
+        self.start_generate(worker)
+        
+    # Function that starts a visualization pipeline on the thread pool
+    def start_generate(self, worker):
+        self.generateworker = worker
+        self.generatebutton.setEnabled(False)
+        self.cancelbutton.setEnabled(True)
+        self.threadpool.start(worker)
+        
+    # Function that cancels the visualization that is being generated
+    def cancel_generate(self):
+        if self.generateworker is not None:
+            self.generateworker.cancel()
+            self.output.setText("Cancelling...")
+        
+    # Function that re-enables the Generate Visualization button after the pipeline has stopped
+    def generate_stopped(self):
+        self.generateworker = None
+        self.generatebutton.setEnabled(True)
+        self.cancelbutton.setEnabled(False)
+        
+    # Function that shows a finished visualization and saves it in the background
+    def generate_finished(self, area, filename, html, report):
+        self.generate_stopped()
+        
+        # The timings are shown once the map has been shown and saved
+        trace = report["trace"]
+        self.pendingtrace = (trace, filename, {"show", "save_html"})
+        
+        # Open the generated HTML visualization from memory using webEngineView
+        self.shownload = (trace, time.perf_counter())
+        self.webEngineView.load(self.maphandler.show(html))
+        
+        # Maps comparing several indicators (area is None) cannot be recoloured
+        self.shownmap = (area, report["areas"]) if area is not None else None
+        
+        # Describe the memory usage of the run
+        details = ""
+        if report.get("memory_after") is not None:
+            megabyte = 1024 * 1024
+            details = ("\n" + str(report["features"]) + " areas, " + str(round(report["html_bytes"] / megabyte, 1)) + " MB of HTML. "
+                       + "Memory: " + str(round(report["memory_before"] / megabyte)) + " MB before, "
+                       + str(round(report["memory_peak"] / megabyte)) + " MB after rendering, "
+                       + str(round(report["memory_after"] / megabyte)) + " MB after the run.")
+        
+        # Save the HTML visualization on the thread pool while it is being shown
+        worker = Worker(CensusEngine.save_html, filename, html, trace=trace)
+        worker.signals.progress.connect(lambda message: self.output.setText(message + details))
+        worker.signals.finished.connect(lambda result: self.save_finished(trace,
+            "Done! Your visualization has been saved as " + filename + ".html in your current working directory." + details))
+        worker.signals.error.connect(lambda message: self.save_finished(trace, "Sorry, the visualization could not be saved: " + message + details))
+        self.threadpool.start(worker)
+        
+    # Function that outputs the message of a finished save of a visualization
+    def save_finished(self, trace, message):
+        self.output.setText(message)
+        self.stage_done(trace, "save_html")
+        
+    # Function that records how long the shown map took to load
+    def map_loaded(self, ok):
+        if self.shownload is None:
+            return
+        trace, start = self.shownload
+        self.shownload = None
+        trace.add("show", start, time.perf_counter() - start, loaded=ok)
+        self.stage_done(trace, "show")
+        
+    # Function that shows the timings of a trace once all of its stages are done
+    def stage_done(self, trace, stage):
+        if self.pendingtrace is None or self.pendingtrace[0] is not trace:
+            return
+        stages = self.pendingtrace[2]
+        stages.discard(stage)
+        if not stages:
+            filename = self.pendingtrace[1]
+            self.pendingtrace = None
+            self.show_timings(trace, filename)
+        
+    # Function that shows the stage timings of a visualization and saves its trace (if the timing check box is checked)
+    def show_timings(self, trace, filename):
+        if not self.timingcheck.isChecked():
+            self.timings.setText("")
+            return
+        
+        text = trace.summary()
+        try:
+            trace.save(filename + "_trace")
+        except OSError as e:
+            text += "\nThe timings could not be saved: " + str(e)
+        self.timings.setText(text)
+        
+    # Function that applies the new values of a recoloured visualization to the shown map
+    def restyle_finished(self, area, characteristic, indicator, filename, topojson, update, report):
+        self.generate_stopped()
+        
+        # If some areas with values are not on the shown map, generate a new visualization instead
+        if update is None:
+            self.generate_map(area, characteristic, indicator, filename, topojson)
+            return
         
-        # Open the generated HTML visualization using webEngineView
-        with open(os.path.join(os.getcwd(), filename + ".html"), 'r') as f:
-            html = f.read()
-            self.webEngineView.setHtml(html)
+        # The timings are shown once the shown map has been recoloured
+        trace = report["trace"]
+        self.pendingtrace = (trace, filename, {"show"})
+        start = time.perf_counter()
+        self.webEngineView.page().runJavaScript("censusvis_restyle(" + json.dumps(update) + ");",
+                                                lambda result: self.map_restyled(trace, start))
+        self.output.setText("Done! The shown map has been recoloured for " + indicator + " (it was not saved).")
+        
+    # Function that records how long the shown map took to recolour
+    def map_restyled(self, trace, start):
+        trace.add("show", start, time.perf_counter() - start)
+        self.stage_done(trace, "show")
+        
+    # Function that outputs the error of a failed visualization
+    def generate_failed(self, message):
+        self.generate_stopped()
+        self.output.setText(message)
+        
+    # Function that outputs the message of a cancelled visualization
+    def generate_cancelled(self):
+        self.generate_stopped()
+        self.output.setText("The visualization was cancelled.")
         
-        # Print finished message
-        self.output.setText("Done! Your visualization has been saved as " + filename + ".html in your current working directory.")
-        del df
 # Show the QtWindow
-app = QApplication(sys.argv)
-window = Window()
-window.show()
-sys.exit(app.exec())
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    window = Window()
+    window.show()
+    sys.exit(app.exec())
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+test_CensusIndex.py
+
+Description: Tests of the local indicator search of CensusIndex (python -m pytest)
+"""
+
+import unittest
+import CensusIndex
+
+DOCUMENTS = [
+    ["http://example.org/census#IncomeTotal", "Total income"],
+    ["http://example.org/census#IncomeAfterTax", "Income after tax"],
+    ["http://example.org/census#IncomeMedian", "Median income"],
+    ["http://example.org/census#Population", "Population"],
+]
+
+class SearchIndexTest(unittest.TestCase):
+    def test_within_narrows_cached_term(self):
+        index = CensusIndex.SearchIndex(DOCUMENTS)
+        # Caches the scores of "income" for every indicator
+        self.assertEqual(len(index.search("income")), 3)
+        within = index.search("income t")
+        self.assertCountEqual(within, [DOCUMENTS[0], DOCUMENTS[1]])
+        # The cached scores of "income" are narrowed to the results of the previous search
+        self.assertCountEqual(index.search("income", within=within), [DOCUMENTS[0], DOCUMENTS[1]])
+        self.assertEqual(index.search("income", within=index.search("income af")), [DOCUMENTS[1]])
+
+    def test_within_narrows_uncached_term(self):
+        index = CensusIndex.SearchIndex(DOCUMENTS)
+        self.assertEqual(index.search("income", within=[DOCUMENTS[2], DOCUMENTS[3]]), [DOCUMENTS[2]])
+
+if __name__ == "__main__":
+    unittest.main()